@@ -1,39 +1,164 @@
 #!/usr/bin/env python3
 
 import argparse
+import errno
 import os
 import sys
 import logging
-import json
 import shutil
+import tempfile
+import threading
+import concurrent.futures
+import functools
+import hashlib
 # import glob # For run_all_pipeline checks -> Removed as unused
 from dotenv import load_dotenv
-import re
 
 # Adjust sys.path
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, project_root)
-sys.path.insert(0, os.path.join(project_root, "src"))
+for _path in (project_root, os.path.join(project_root, "src")):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
 
 try:
-    from src.agents.script_agent import app as script_agent_app, ScriptGenerationState
-    from src.agents.manim_agent import generate_manim_code_from_script
-    from src.tools.audio_tool import generate_audio_from_script
-    from src.tools.render_manim_tool import render_manim_scenes, find_scene_name # Added find_scene_name
-    from src.tools.video_tool import create_video_from_script
     from src.utils.custom_logging import setup_custom_logging
+    from src.utils.json_utils import load_json_bytes, dump_json_bytes
+    from src.agents.constants import SCENE_WAVE_SIZE
 except ImportError as e:
     print(f"Error importing modules: {e}")
     print("Please ensure that the 'src' directory is structured correctly and all dependencies are installed.")
-    print("It's also possible that some tools (e.g., audio_tool, render_manim_tool) have their own specific dependencies not yet installed.")
     sys.exit(1)
 
 logger = setup_custom_logging(logger_name="EuiCli")
 
+
 # --- Define command functions (with workarounds for now) ---
+# Agents and tools are imported inside each run_* function so a subcommand only pays for the modules it uses.
+
+def _log_import_error(e: ImportError) -> None:
+    logger.error(f"Error importing modules: {e}")
+    logger.error("Please ensure that the 'src' directory is structured correctly and all dependencies are installed.")
+    logger.error("It's also possible that some tools (e.g., audio_tool, render_manim_tool) have their own specific dependencies not yet installed.")
+
+# Read once at startup (os.umask can only be queried by setting it) so atomically written files get the usual mode.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _write_script_json(path: str, data: list) -> None:
+    # Write to a temp file in the same directory and rename over the target, so readers never see a truncated script.
+    with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(path) or ".", prefix=".script_", suffix=".json.tmp", delete=False) as f:
+        tmp_path = f.name
+        try:
+            f.write(dump_json_bytes(data))
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.chmod(tmp_path, 0o666 & ~_UMASK) # NamedTemporaryFile creates 0600; match what open() would have created
+    os.replace(tmp_path, path)
+
+@functools.lru_cache(maxsize=4)
+def _load_script_cached(path: str, mtime_ns: int) -> list:
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return load_json_bytes(raw)
+
+def _snapshot(path: str) -> dict[str, os.DirEntry]:
+    """Maps entry name -> DirEntry for one directory with a single readdir; a missing directory maps to {}."""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name: entry for entry in it}
+    except FileNotFoundError:
+        return {}
+
+def _cache_key(input_paths: list[str], extra: str = "") -> str:
+    h = hashlib.blake2b(extra.encode('utf-8'), digest_size=16)
+    for path in input_paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def _cache_key_path(output_path: str) -> str:
+    return output_path.rstrip(os.sep) + ".cache_key"
+
+def _cache_valid(output_path: str, key: str) -> bool:
+    """True if output_path exists (non-empty, for directories) and was produced from inputs hashing to key."""
+    key_path = _cache_key_path(output_path)
+    if not os.path.exists(output_path) or not os.path.exists(key_path):
+        return False
+    if os.path.isdir(output_path) and _is_empty_dir(output_path):
+        return False
+    with open(key_path, 'r', encoding='utf-8') as f:
+        return f.read() == key
+
+def _write_cache_key(output_path: str, key: str) -> None:
+    with open(_cache_key_path(output_path), 'w', encoding='utf-8') as f:
+        f.write(key)
+
+def _invalidate_cache(output_path: str) -> None:
+    # Drop the sidecar before re-running a step so a failed run is never mistaken for a cached one.
+    try:
+        os.remove(_cache_key_path(output_path))
+    except FileNotFoundError:
+        pass
+
+def _is_empty_dir(path: str) -> bool:
+    # Stops after the first entry instead of listing the whole directory; a missing directory counts as empty.
+    try:
+        with os.scandir(path) as it:
+            return next(it, None) is None
+    except FileNotFoundError:
+        return True
+
+def iter_code_blocks(path: str):
+    """Yields the body of each fenced code block in a markdown file, reading it line by line."""
+    in_block = False
+    buf: list[str] = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith("```"):
+                if in_block:
+                    yield "".join(buf).rstrip("\n")
+                else:
+                    buf.clear()
+                in_block = not in_block
+            elif in_block:
+                buf.append(line)
+
+def _load_script_once(path: str) -> list:
+    # Keyed on mtime so a rewritten script.json is re-parsed instead of served stale.
+    return _load_script_cached(path, os.stat(path).st_mtime_ns)
+
+_LINK_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP} # Cases where a hard link can't be made
+
+def _fast_link(src: str, dst: str) -> None:
+    # Hard link is metadata-only; fall back to copyfile (kernel-side sendfile on Linux) across filesystems.
+    # Built under a per-thread temp name and renamed over dst, so an existing dst (possibly a hard link to another
+    # scene's rendered video) is replaced instead of written through, even when links run concurrently.
+    tmp_dst = f"{dst}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            os.link(src, tmp_dst)
+        except OSError as e:
+            if e.errno not in _LINK_FALLBACK_ERRNOS:
+                raise
+            shutil.copyfile(src, tmp_dst)
+        os.replace(tmp_dst, dst)
+    except BaseException:
+        if os.path.lexists(tmp_dst):
+            os.remove(tmp_dst)
+        raise
 
 def run_generate_script(topic: str, output_path: str) -> bool:
     logger.info(f"Starting script generation for topic: '{topic}' -> {output_path}")
+    try:
+        from src.agents.script_agent import app as script_agent_app, ScriptGenerationState
+    except ImportError as e:
+        _log_import_error(e)
+        return False
+
     try:
         # Ensure output directory exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -50,13 +175,11 @@ def run_generate_script(topic: str, output_path: str) -> bool:
                 return False
             parsed_script = final_state.get("parsed_script")
             if parsed_script:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(parsed_script, f, indent=4)
+                _write_script_json(output_path, parsed_script)
                 logger.info(f"Script successfully generated and saved to {output_path}")
                 return True
         elif hasattr(final_state, 'parsed_script') and final_state.parsed_script: # If it's an object
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(final_state.parsed_script, f, indent=4)
+            _write_script_json(output_path, final_state.parsed_script)
             logger.info(f"Script successfully generated and saved to {output_path}")
             return True
         elif hasattr(final_state, 'error_message') and final_state.error_message:
@@ -69,14 +192,20 @@ def run_generate_script(topic: str, output_path: str) -> bool:
         logger.exception(f"An unexpected error occurred during script generation for topic '{topic}': {e}")
         return False
 
-def run_generate_manim_code(script_path: str, code_md_path: str) -> bool:
+def run_generate_manim_code(script_path: str, code_md_path: str, scene_concurrency: int | None = None, resume: bool = True, script_data: list | None = None) -> bool:
     logger.info(f"Starting Manim code generation from script: '{script_path}' -> {code_md_path}")
+    try:
+        from src.agents.manim_agent import generate_manim_code_from_script
+    except ImportError as e:
+        _log_import_error(e)
+        return False
+
     try:
         if not os.path.exists(script_path):
             logger.error(f"Input script {script_path} not found.")
             return False
 
-        success = generate_manim_code_from_script(script_json_path=script_path, output_code_md_path=code_md_path)
+        success = generate_manim_code_from_script(script_json_path=script_path, output_code_md_path=code_md_path, script_data=script_data, scene_concurrency=scene_concurrency, resume=resume)
         if success:
             logger.info(f"Manim code generation successful. Output at {code_md_path}")
             return True
@@ -87,8 +216,14 @@ def run_generate_manim_code(script_path: str, code_md_path: str) -> bool:
         logger.exception(f"An unexpected error occurred during Manim code generation: {e}")
         return False
 
-def run_generate_audio(script_path: str, audio_dir: str) -> bool:
+def run_generate_audio(script_path: str, audio_dir: str, audio_workers: int = 1, script_data: list | None = None) -> bool:
     logger.info(f"Starting audio generation from script: '{script_path}' -> {audio_dir}")
+    try:
+        from src.tools.audio_tool import generate_audio_from_script
+    except ImportError as e:
+        _log_import_error(e)
+        return False
+
     try:
         if not os.path.exists(script_path):
             logger.error(f"Input script {script_path} not found.")
@@ -105,11 +240,13 @@ def run_generate_audio(script_path: str, audio_dir: str) -> bool:
             script_json_path=script_path,
             output_audio_dir=audio_dir,
             audio_generator_tool_script_path=audio_generator_script,
-            current_project_root=project_root
+            current_project_root=project_root,
+            script_data=script_data,
+            num_workers=audio_workers
         )
         if success:
             logger.info(f"Audio generation process completed. Output potentially in {audio_dir}")
-            if not os.listdir(audio_dir): # Check if directory is empty
+            if _is_empty_dir(audio_dir):
                  logger.warning(f"Audio generation reported success, but output directory {audio_dir} is empty.")
             return True # Still return true as the tool itself might not consider empty output an error
         else:
@@ -121,6 +258,12 @@ def run_generate_audio(script_path: str, audio_dir: str) -> bool:
 
 def run_render_video(code_md_path: str, media_dir_target: str) -> bool:
     logger.info(f"Starting Manim scene rendering from code: '{code_md_path}' -> {media_dir_target}")
+    try:
+        from src.tools.render_manim_tool import render_manim_scenes
+    except ImportError as e:
+        _log_import_error(e)
+        return False
+
     try:
         if not os.path.exists(code_md_path):
             logger.error(f"Input Manim code file {code_md_path} not found.")
@@ -138,7 +281,7 @@ def run_render_video(code_md_path: str, media_dir_target: str) -> bool:
         )
         if success:
             logger.info(f"Manim rendering process completed. Output media should be in {media_dir_target}")
-            if not os.path.exists(media_dir_target) or not any(os.scandir(media_dir_target)):
+            if _is_empty_dir(media_dir_target):
                 logger.warning(f"Manim rendering reported success, but the output directory {media_dir_target} is empty or was not created.")
                 # This could be a soft failure depending on expectations.
             return True
@@ -149,27 +292,39 @@ def run_render_video(code_md_path: str, media_dir_target: str) -> bool:
         logger.exception(f"An unexpected error occurred during Manim video rendering: {e}")
         return False
 
-def run_create_final_video(script_path: str, audio_input_dir_param: str, manim_scenes_input_dir_param: str, final_video_path: str) -> bool:
+def run_create_final_video(script_path: str, audio_input_dir_param: str, manim_scenes_input_dir_param: str, final_video_path: str, script_data: list | None = None) -> bool:
     logger.info(f"Starting final video creation. Script: '{script_path}', Audio: '{audio_input_dir_param}', Manim scenes: '{manim_scenes_input_dir_param}' -> Video: '{final_video_path}'")
+    try:
+        from src.tools.video_tool import create_video_from_script
+    except ImportError as e:
+        _log_import_error(e)
+        return False
+
     try:
         if not os.path.exists(script_path):
             logger.error(f"Input script {script_path} not found.")
             return False
         # It's okay if audio/video dirs don't exist yet, tool should handle it.
         # But warn if they are unexpectedly empty if they DO exist.
-        if os.path.exists(audio_input_dir_param) and not os.listdir(audio_input_dir_param): # Check if dir is empty
+        if os.path.exists(audio_input_dir_param) and _is_empty_dir(audio_input_dir_param):
             logger.warning(f"Audio input directory {audio_input_dir_param} exists but is empty.")
-        if os.path.exists(manim_scenes_input_dir_param) and not os.listdir(manim_scenes_input_dir_param): # Check if dir is empty
+        if os.path.exists(manim_scenes_input_dir_param) and _is_empty_dir(manim_scenes_input_dir_param):
             logger.warning(f"Manim scenes input directory {manim_scenes_input_dir_param} exists but is empty.")
 
+        abs_script_path = os.path.abspath(script_path)
+        abs_audio_input_dir = os.path.abspath(audio_input_dir_param)
+        abs_manim_scenes_input_dir = os.path.abspath(manim_scenes_input_dir_param)
+        abs_final_video_path = os.path.abspath(final_video_path)
+
         create_video_from_script(
             logger=logger,
-            script_filepath=os.path.abspath(script_path),
-            audio_input_dir=os.path.abspath(audio_input_dir_param),
-            manim_scenes_input_dir=os.path.abspath(manim_scenes_input_dir_param),
-            output_filepath=os.path.abspath(final_video_path)
+            script_filepath=abs_script_path,
+            audio_input_dir=abs_audio_input_dir,
+            manim_scenes_input_dir=abs_manim_scenes_input_dir,
+            output_filepath=abs_final_video_path,
+            script_items=script_data
         )
-        if os.path.exists(final_video_path):
+        if os.path.exists(abs_final_video_path):
             logger.info(f"Final video created successfully at {final_video_path}")
             return True
         else:
@@ -179,7 +334,7 @@ def run_create_final_video(script_path: str, audio_input_dir_param: str, manim_s
         logger.exception(f"An unexpected error occurred during final video creation: {e}")
         return False
 
-def run_all_pipeline(topic: str, output_dir_base: str) -> bool: # Added return type
+def run_all_pipeline(topic: str, output_dir_base: str, parallel: bool = True, force: bool = False, audio_workers: int = 1, scene_concurrency: int | None = None) -> bool: # Added return type
     logger.info(f"Starting full pipeline for topic: '{topic}'. Output base directory: {output_dir_base}")
     try:
         os.makedirs(output_dir_base, exist_ok=True)
@@ -191,55 +346,108 @@ def run_all_pipeline(topic: str, output_dir_base: str) -> bool: # Added return t
         final_video_filename = f"{topic.replace(' ', '_').replace('-', '_').lower()}_final.mp4"
         user_final_video_output_path = os.path.join(output_dir_base, final_video_filename)
 
-        logger.info("--- Step 1: Generating Script ---")
-        if not run_generate_script(topic, user_script_json_output_path):
-            logger.error("Script generation failed. Aborting pipeline.")
-            return False
+        # Each step is skipped when its output exists and a .cache_key sidecar matches the hash of its inputs.
+        script_key = _cache_key([], extra=topic)
+        if not force and _cache_valid(user_script_json_output_path, script_key):
+            logger.info("--- Step 1: Skipped, script.json is up to date for this topic ---")
+        else:
+            logger.info("--- Step 1: Generating Script ---")
+            _invalidate_cache(user_script_json_output_path)
+            if not run_generate_script(topic, user_script_json_output_path):
+                logger.error("Script generation failed. Aborting pipeline.")
+                return False
+            _write_cache_key(user_script_json_output_path, script_key)
 
-        logger.info("--- Step 2: Generating Manim Code ---")
-        if not run_generate_manim_code(user_script_json_output_path, user_code_md_output_path):
-            logger.error("Manim code generation failed. Aborting pipeline.")
-            return False
+        # Parse script.json once and hand it to every later step instead of re-reading it from disk.
+        script_data = _load_script_once(user_script_json_output_path)
+
+        code_md_key = _cache_key([user_script_json_output_path])
+        if not force and _cache_valid(user_code_md_output_path, code_md_key):
+            logger.info("--- Step 2: Skipped, code.md is up to date with script.json ---")
+        else:
+            logger.info("--- Step 2: Generating Manim Code ---")
+            _invalidate_cache(user_code_md_output_path)
+            if not run_generate_manim_code(user_script_json_output_path, user_code_md_output_path, scene_concurrency, not force, script_data=script_data):
+                logger.error("Manim code generation failed. Aborting pipeline.")
+                return False
+            _write_cache_key(user_code_md_output_path, code_md_key)
+
+        audio_key = _cache_key([user_script_json_output_path])
+        render_key = _cache_key([user_code_md_output_path])
+        audio_cached = not force and _cache_valid(user_audio_output_dir, audio_key)
+        render_cached = not force and _cache_valid(user_manim_media_output_dir, render_key)
+        if not audio_cached:
+            _invalidate_cache(user_audio_output_dir)
+        if not render_cached:
+            _invalidate_cache(user_manim_media_output_dir)
+
+        audio_ok = render_ok = True
+        if parallel and not audio_cached and not render_cached:
+            # Audio (TTS, GPU-bound) and Manim rendering (CPU/ffmpeg-bound) are independent, so overlap them.
+            # Both stages only wait on their own child processes, so threads give the same overlap as processes.
+            logger.info("--- Steps 3 & 4: Generating Audio and Rendering Manim Video Scenes (in parallel) ---")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                futures = {
+                    executor.submit(run_generate_audio, user_script_json_output_path, user_audio_output_dir, audio_workers, script_data): "audio",
+                    executor.submit(run_render_video, user_code_md_output_path, user_manim_media_output_dir): "render",
+                }
+                stage_results = {}
+                for future in concurrent.futures.as_completed(futures):
+                    stage_results[futures[future]] = future.result()
+            audio_ok = stage_results["audio"]
+            render_ok = stage_results["render"]
+        else:
+            if audio_cached:
+                logger.info("--- Step 3: Skipped, audio files are up to date with script.json ---")
+            else:
+                logger.info("--- Step 3: Generating Audio ---")
+                audio_ok = run_generate_audio(user_script_json_output_path, user_audio_output_dir, audio_workers, script_data=script_data)
+            if render_cached:
+                logger.info("--- Step 4: Skipped, Manim media is up to date with code.md ---")
+            else:
+                logger.info("--- Step 4: Rendering Manim Video Scenes ---")
+                render_ok = run_render_video(user_code_md_output_path, user_manim_media_output_dir)
+
+        if audio_ok and not audio_cached and not _is_empty_dir(user_audio_output_dir):
+            _write_cache_key(user_audio_output_dir, audio_key)
+        if render_ok and not render_cached and not _is_empty_dir(user_manim_media_output_dir):
+            _write_cache_key(user_manim_media_output_dir, render_key)
 
-        logger.info("--- Step 3: Generating Audio ---")
         # Audio generation is considered non-critical for now; pipeline continues with a warning.
-        if not run_generate_audio(user_script_json_output_path, user_audio_output_dir):
+        if not audio_ok:
             logger.warning(f"Audio generation step failed or produced no output. Output may be missing in {user_audio_output_dir}. Continuing pipeline.")
-        elif not os.listdir(user_audio_output_dir):
+        elif _is_empty_dir(user_audio_output_dir):
             logger.warning(f"Audio generation step completed, but the output directory {user_audio_output_dir} is empty. Final video may lack audio.")
         else:
             logger.info(f"Audio files successfully generated in {user_audio_output_dir}")
 
-        logger.info("--- Step 4: Rendering Manim Video Scenes ---")
         # Manim rendering is also considered non-critical for now if individual scenes fail.
         # render_manim_scenes returns True if the process ran, False for setup errors.
         # Individual scene errors are logged by render_manim_scenes itself.
-        if not run_render_video(user_code_md_output_path, user_manim_media_output_dir):
+        if not render_ok:
             logger.warning(f"Manim rendering step reported issues (e.g. setup error, or all scenes failed). Output may be incomplete in {user_manim_media_output_dir}. Continuing pipeline.")
-        elif not os.path.exists(user_manim_media_output_dir) or not os.listdir(user_manim_media_output_dir):
+        elif _is_empty_dir(user_manim_media_output_dir):
              logger.warning(f"Manim rendering step completed, but the output directory {user_manim_media_output_dir} is empty. Final video may lack Manim scenes.")
         else:
             logger.info(f"Manim scenes successfully rendered to {user_manim_media_output_dir}")
 
         logger.info("--- Step 5: Preparing Manim Videos for Final Stitching ---")
+        # One readdir each for the output base and the rendered media replaces a stat per file/scene below.
+        base_entries = _snapshot(output_dir_base)
+        media_entries = _snapshot(user_manim_media_output_dir)
         temp_flat_manim_dir = os.path.join(output_dir_base, "temp_flat_manim_for_stitching")
-        if os.path.exists(temp_flat_manim_dir):
+        if "temp_flat_manim_for_stitching" in base_entries:
             shutil.rmtree(temp_flat_manim_dir)
         os.makedirs(temp_flat_manim_dir, exist_ok=True)
 
         manim_prep_ok = True
-        script_data = [] # Initialize script_data
+        scene_videos: list[tuple[str, str, int, str]] = [] # (src, dst, scene number, class name)
         try:
-            with open(user_script_json_output_path, 'r', encoding='utf-8') as f:
-                script_data = json.load(f)
+            from src.tools.render_manim_tool import find_scene_name
 
             manim_code_blocks = []
-            if os.path.exists(user_code_md_output_path):
-                with open(user_code_md_output_path, 'r', encoding='utf-8') as f_code:
-                    content = f_code.read()
-            # find_scene_name is now imported at the top of the file
-                code_pattern = r"```(?:python)?\s*\n(.*?)\n```"
-                manim_code_blocks = re.findall(code_pattern, content, re.DOTALL)
+            if "code.md" in base_entries:
+                manim_code_blocks = list(iter_code_blocks(user_code_md_output_path))
             else:
                 logger.error(f"Manim code file {user_code_md_output_path} not found. Cannot map Manim class names for video stitching.")
                 manim_prep_ok = False
@@ -260,12 +468,17 @@ def run_all_pipeline(topic: str, output_dir_base: str) -> bool: # Added return t
 
                     src_video_path = os.path.join(user_manim_media_output_dir, f"{manim_class_name}.mp4")
                     dest_video_path = os.path.join(temp_flat_manim_dir, f"{scene_number}.mp4")
-
-                    if os.path.exists(src_video_path):
-                        shutil.copy(src_video_path, dest_video_path)
-                        logger.debug(f"Copied Manim video for scene {scene_number} ({manim_class_name}.mp4) to {dest_video_path}")
-                    else:
+                    if f"{manim_class_name}.mp4" not in media_entries:
                         logger.warning(f"Manim video file {src_video_path} (for scene {scene_number}, class {manim_class_name}) not found. It will be missing from the final video.")
+                        continue
+                    scene_videos.append((src_video_path, dest_video_path, scene_number, manim_class_name))
+
+                # The per-scene link/copy calls are independent I/O, so issue them concurrently.
+                if scene_videos:
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(scene_videos))) as executor:
+                        list(executor.map(lambda v: _fast_link(v[0], v[1]), scene_videos))
+                    for src_video_path, dest_video_path, scene_number, manim_class_name in scene_videos:
+                        logger.debug(f"Linked Manim video for scene {scene_number} ({manim_class_name}.mp4) to {dest_video_path}")
 
         except ImportError:
             logger.exception("Failed to import 'find_scene_name' for Manim video preparation. This is a critical setup error.")
@@ -276,10 +489,10 @@ def run_all_pipeline(topic: str, output_dir_base: str) -> bool: # Added return t
 
         if not manim_prep_ok:
             logger.error("Due to critical errors in Manim video preparation, cannot proceed to final video stitching. Aborting.")
-            if os.path.exists(temp_flat_manim_dir): shutil.rmtree(temp_flat_manim_dir)
+            shutil.rmtree(temp_flat_manim_dir, ignore_errors=True)
             return False
 
-        if not os.listdir(temp_flat_manim_dir) and len(script_data) > 0:
+        if not scene_videos and len(script_data) > 0:
              logger.warning(f"Flattened Manim scenes directory ({temp_flat_manim_dir}) is empty. The final video might not contain any Manim scenes.")
 
 
@@ -288,14 +501,15 @@ def run_all_pipeline(topic: str, output_dir_base: str) -> bool: # Added return t
             script_path=user_script_json_output_path,
             audio_input_dir_param=user_audio_output_dir,
             manim_scenes_input_dir_param=temp_flat_manim_dir,
-            final_video_path=user_final_video_output_path
+            final_video_path=user_final_video_output_path,
+            script_data=script_data
         ):
             logger.error("Final video stitching failed. Pipeline did not complete successfully.")
-            if os.path.exists(temp_flat_manim_dir): shutil.rmtree(temp_flat_manim_dir) # Clean up temp dir
+            shutil.rmtree(temp_flat_manim_dir, ignore_errors=True) # Clean up temp dir
             return False
 
         logger.info(f"Final video successfully created at {user_final_video_output_path}")
-        if os.path.exists(temp_flat_manim_dir): shutil.rmtree(temp_flat_manim_dir)
+        shutil.rmtree(temp_flat_manim_dir, ignore_errors=True)
 
         logger.info(f"--- Full pipeline successfully finished for topic: '{topic}' ---")
         logger.info(f"All outputs are in: {output_dir_base}")
@@ -305,6 +519,22 @@ def run_all_pipeline(topic: str, output_dir_base: str) -> bool: # Added return t
         logger.exception(f"A critical unexpected error occurred in the 'all' pipeline: {e}")
         return False
 
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+# Maps each subcommand to its handler and the parsed argument names passed to it, in order.
+COMMANDS = {
+    "generate-script": (run_generate_script, ("topic", "output")),
+    "generate-manim-code": (run_generate_manim_code, ("script", "output", "scene_concurrency", "resume")),
+    "generate-audio": (run_generate_audio, ("script", "output_dir", "audio_workers")),
+    "render-video": (run_render_video, ("code", "media_dir")),
+    "create-final-video": (run_create_final_video, ("script", "audio_input_dir", "manim_input_dir", "output")),
+    "all": (run_all_pipeline, ("topic", "output_dir", "parallel", "force", "audio_workers", "scene_concurrency")),
+}
+
 def main():
     load_dotenv()
     parser = argparse.ArgumentParser(description="Eui CLI tool for video creation pipeline.")
@@ -317,40 +547,41 @@ def main():
     default_audio_output_dir = os.path.join(default_output_base, "audio_files")
     default_manim_media_dir = os.path.join(default_output_base, "manim_media_output")
     default_final_video_output = os.path.join(default_output_base, "final_video.mp4")
-    default_pipeline_output_dir = os.path.join(project_root, "output", "full_pipeline_run")
+    default_pipeline_output_dir = os.path.join(default_output_base, "full_pipeline_run")
 
 
     gs_parser = subparsers.add_parser("generate-script", help="Generate script JSON from a topic.")
     gs_parser.add_argument("--topic", required=True, help="Video topic.")
     gs_parser.add_argument("--output", default=default_script_output, help=f"Script JSON output path (default: {default_script_output}).")
-    gs_parser.set_defaults(func=lambda args: run_generate_script(args.topic, args.output))
 
     gmc_parser = subparsers.add_parser("generate-manim-code", help="Generate Manim code from script JSON.")
     gmc_parser.add_argument("--script", default=default_script_output, help=f"Input script JSON path (default: {default_script_output}).")
     gmc_parser.add_argument("--output", default=default_manim_code_output, help=f"Manim code Markdown output path (default: {default_manim_code_output}).")
-    gmc_parser.set_defaults(func=lambda args: run_generate_manim_code(args.script, args.output))
+    gmc_parser.add_argument("--scene_concurrency", type=_positive_int, default=None, help=f"Scenes whose Manim code is generated concurrently after the first scene, each using the previous wave's last script as context; 1 gives every scene its predecessor's code (default: {SCENE_WAVE_SIZE}).")
+    gmc_parser.add_argument("--resume", action=argparse.BooleanOptionalAction, default=True, help="Reuse scenes that the existing output file already records as successfully generated (default: enabled).")
 
     ga_parser = subparsers.add_parser("generate-audio", help="Generate audio from script JSON.")
     ga_parser.add_argument("--script", default=default_script_output, help=f"Input script JSON path (default: {default_script_output}).")
     ga_parser.add_argument("--output_dir", default=default_audio_output_dir, help=f"Output directory for audio files (default: {default_audio_output_dir}).")
-    ga_parser.set_defaults(func=lambda args: run_generate_audio(args.script, args.output_dir))
+    ga_parser.add_argument("--audio_workers", type=_positive_int, default=1, help="Number of parallel TTS worker processes; each loads its own model (default: 1).")
 
     rv_parser = subparsers.add_parser("render-video", help="Render Manim videos from code.")
     rv_parser.add_argument("--code", default=default_manim_code_output, help=f"Input Manim code Markdown path (default: {default_manim_code_output}).")
     rv_parser.add_argument("--media_dir", default=default_manim_media_dir, help=f"Output directory for rendered Manim media (default: {default_manim_media_dir}).")
-    rv_parser.set_defaults(func=lambda args: run_render_video(args.code, args.media_dir))
 
     cfv_parser = subparsers.add_parser("create-final-video", help="Create final video from rendered scenes and audio.")
     cfv_parser.add_argument("--script", default=default_script_output, help=f"Input script JSON path (default: {default_script_output}).")
     cfv_parser.add_argument("--audio_input_dir", default=default_audio_output_dir, help=f"Directory containing numbered audio files (e.g., 1.mp3) (default: {default_audio_output_dir}).")
     cfv_parser.add_argument("--manim_input_dir", default=default_manim_media_dir, help=f"Directory containing **numbered** Manim video scene files (e.g., 1.mp4, 2.mp4) ready for stitching. User must prepare this structure. (default: {default_manim_media_dir}).")
     cfv_parser.add_argument("--output", default=default_final_video_output, help=f"Final video output path (default: {default_final_video_output}).")
-    cfv_parser.set_defaults(func=lambda args: run_create_final_video(args.script, args.audio_input_dir, args.manim_input_dir, args.output))
 
     all_parser = subparsers.add_parser("all", help="Run the full video generation pipeline.")
     all_parser.add_argument("--topic", required=True, help="Video topic.")
     all_parser.add_argument("--output_dir", default=default_pipeline_output_dir, help=f"Base directory for all pipeline outputs (default: {default_pipeline_output_dir}).")
-    all_parser.set_defaults(func=lambda args: run_all_pipeline(args.topic, args.output_dir))
+    all_parser.add_argument("--parallel", action=argparse.BooleanOptionalAction, default=True, help="Run audio generation and Manim rendering concurrently (default: enabled).")
+    all_parser.add_argument("--audio_workers", type=_positive_int, default=1, help="Number of parallel TTS worker processes; each loads its own model (default: 1).")
+    all_parser.add_argument("--scene_concurrency", type=_positive_int, default=None, help=f"Scenes whose Manim code is generated concurrently after the first scene, each using the previous wave's last script as context; 1 gives every scene its predecessor's code (default: {SCENE_WAVE_SIZE}).")
+    all_parser.add_argument("--force", action="store_true", help="Re-run every step even if its cached output is up to date with its inputs.")
 
     args = parser.parse_args()
 
@@ -371,7 +602,8 @@ def main():
         # Each run_... function is expected to return True for success, False for failure.
         # They should also do their own specific error logging.
         # run_all_pipeline will return True only if all critical steps succeeded.
-        success = args.func(args)
+        command_func, arg_names = COMMANDS[args.command]
+        success = command_func(*(getattr(args, name) for name in arg_names))
     except Exception as e:
         logger.exception(f"An unexpected error/exception occurred at the top level of command '{args.command}': {e}")
         success = False # Ensure sys.exit(1) is called
@@ -0,0 +1,2 @@
+# Settings shared with the CLI, kept free of the agents' heavy imports so argparse can use them.
+SCENE_WAVE_SIZE = 4 # Scenes whose Gemini calls run concurrently; also bounds in-flight requests for rate limits
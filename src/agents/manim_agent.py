@@ -1,35 +1,354 @@
+import ast
+import atexit
+import concurrent.futures
+import functools
+import hashlib
+import itertools
+import shlex
+import shutil
+import sqlite3
 import json
+import random
 import os
 import re
 import subprocess
 import tempfile
+import threading
+import time
 import logging
 from typing import TypedDict, Optional, Set
 
 from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, END
 
 from ..utils.custom_logging import setup_custom_logging, log_node_ctx
+from ..utils.json_utils import load_json_bytes
+from .constants import SCENE_WAVE_SIZE
 from ..tools.class_defination_tool import extract_class_info_from_file
 
 logger = setup_custom_logging(logger_name="ManimAgent")
 
-COMMON_ERROR_FILE_PATH = os.path.join(os.getcwd(), "prompts", "common_error.md")
-CLASS_METHODS_FILE_PATH = os.path.join(os.getcwd(), "class_methods.txt")
+PROJECT_ROOT = os.getcwd() # Resolved once at import; every project path below is relative to it
+COMMON_ERROR_FILE_PATH = os.path.join(PROJECT_ROOT, "prompts", "common_error.md")
+CLASS_METHODS_FILE_PATH = os.path.join(PROJECT_ROOT, "class_methods.txt")
+GEMINI_CACHE_PATH = os.path.join(PROJECT_ROOT, ".cache", "gemini.sqlite3")
 
-try:
-    with open(COMMON_ERROR_FILE_PATH, "r", encoding="utf-8") as f:
-        COMMON_ERROR_CONTENT = f.read()
-except FileNotFoundError:
-    logger.warning(f"Common error file not found at {COMMON_ERROR_FILE_PATH}. Proceeding without it.")
-    COMMON_ERROR_CONTENT = "Common error content not available. Please check the path."
+# Identical for every call, so it is sent as the system instruction and Gemini can reuse it across requests.
+SYSTEM_PROMPT_TEMPLATE = """
+#####################################################
+Generate a complete, runnable Manim Python script for the
+following animation description. The script should be a single scene
+class that inherits from Scene or a relevant Manim base Scene class (e.g., MovingCameraScene, ZoomedScene). 
+Do not include any explanation, just the code inside a single python code block.
+Optimized for youtube shorts; Keep animations at the center;
+No code diffes that are too big. Always use simple shapes.
+make sure the old and new verison have coharance;
+the old COULD BE the starting point for the new scean if present. ALSO NOT DEPENDS ON YOU.
+#####################################################
+
+#####################################################
+Common Errors to avoid (Review these carefully):
+{common_error_content}
+#####################################################
+"""
+
+# Per-call prompt pieces, parsed once at import and filled in with str.format.
+TYPE_CHECK_FEEDBACK_TEMPLATE = """
+#####################################################
+The following code was generated for the current animation description (given below)
+but failed static type checking:
+
+Problematic Code:
+'''python
+{current_attempt_script}
+'''
+
+Static Type Checker Output (Errors):
+'''
+{type_check_feedback}
+'''
+"""
+
+RETRY_INSTRUCTIONS = """
+Please analyze these errors and the provided class definitions (if any) and provide a corrected Manim script.
+Ensure the new script is complete, runnable, and addresses these type errors.
+#####################################################"""
+
+PREVIOUS_CODE_TEMPLATE = """
+#####################################################
+Context from a previously generated animation scene (if available):
+Previous Code:
+'''python
+{previous_item_code}
+'''
+#####################################################"""
+
+SCENE_PROMPT_TEMPLATE = """
+{final_context_prompt}
+
+#####################################################
+Current Animation Description:
+{animation_description}
+#####################################################
+"""
 
 MAX_TYPE_CHECK_RETRIES = 2
 INITIAL_MODEL_NAME = "gemini-2.5-pro-preview-05-06"
 RETRY_MODEL_NAME = "gemini-2.5-pro-preview-05-06"
+GEMINI_MAX_RETRIES = 6 # Retries of a whole streamed call after a transient Gemini error
+GEMINI_RETRY_BASE_SECONDS = 2.0 # Backoff doubles from here per retry...
+GEMINI_RETRY_MAX_SECONDS = 60.0 # ...up to this cap
+# Rate limiting and server-side failures; anything else (bad request, auth, ...) fails the call immediately.
+RETRYABLE_GEMINI_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+PREVIOUS_CODE_HEAD_LINES = 20 # Imports, class header and scene setup
+PREVIOUS_CODE_TAIL_LINES = 40 # Final animations, i.e. where the next scene picks up
+STREAM_CODE_CHECK_CHARS = 400 # Streamed characters after which a response must look like code
+CODE_MARKERS = ("```", "import ", "class ")
+PYRIGHT_BATCH_WINDOW_SECONDS = 0.25 # How long a type check waits for other scenes' checks to share its pyright run
+
+@functools.lru_cache(maxsize=4)
+def _read_common_error_content(path: str, mtime_ns: Optional[int]) -> str:
+    # Cached per (path, mtime), so an edited file is re-read without restarting; None means the file is missing.
+    try:
+        if mtime_ns is not None:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+    except FileNotFoundError:
+        pass
+    logger.warning(f"Common error file not found at {path}. Proceeding without it.")
+    return "Common error content not available. Please check the path."
+
+def get_common_error_content() -> str:
+    # Read on first use instead of at import, so importing the module does no file I/O.
+    try:
+        mtime_ns = os.stat(COMMON_ERROR_FILE_PATH).st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+    return _read_common_error_content(COMMON_ERROR_FILE_PATH, mtime_ns)
+
+@functools.lru_cache(maxsize=4)
+def _format_system_prompt(common_error_content: str) -> str:
+    return SYSTEM_PROMPT_TEMPLATE.format(common_error_content=common_error_content)
+
+def get_system_prompt() -> str:
+    return _format_system_prompt(get_common_error_content())
+
+@functools.lru_cache(maxsize=None)
+def get_llm(model_name: str) -> ChatGoogleGenerativeAI:
+    # One client per model for the whole process, so its connection pool is reused across scenes and retries.
+    # Transient failures are retried by stream_gemini_response_with_retry, not by the client.
+    return ChatGoogleGenerativeAI(model=model_name)
+
+# Optional ```/```python fence, optional stray "python" language line, the code, optional closing fence.
+_CODE_FENCE_RE = re.compile(r"\A\s*(?:```(?:python)?)?\s*(?:(?i:python)[ \n])?(.*?)(?:```)?\s*\Z", re.DOTALL)
+
+# A scene that passed type checking in a previously written code.md: (description, code).
+_SUCCESSFUL_SCENE_RE = re.compile(
+    r"^### Animation Scene [^\n]*\n\*\*Description:\*\* ((?:(?!\n\n\*\*Status:\*\*).)*)\n\n"
+    r"\*\*Status:\*\* Generation successful \(passed type checks\)\.\n\n```python\n(.*?)\n```\n\n",
+    re.DOTALL | re.MULTILINE,
+)
+
+# Class names quoted in pyright messages; also covers the 'for class "X"' form.
+_CLASS_NAME_RE = re.compile(r'class "([^"]+)"', re.IGNORECASE)
+
+_response_cache: dict[str, str] = {} # In-process layer over GEMINI_CACHE_PATH
+_response_cache_lock = threading.Lock() # Scenes in a wave share the one sqlite connection
+
+def response_cache_key(model_name: str, prompt: str) -> str:
+    return hashlib.blake2b(f"{model_name}\0{prompt}".encode("utf-8"), digest_size=20).hexdigest()
+
+def gemini_cache_enabled() -> bool:
+    # EUI_DISABLE_GEMINI_CACHE=1 forces fresh generations (e.g. after changing the prompt files by hand).
+    return os.getenv("EUI_DISABLE_GEMINI_CACHE", "").lower() not in ("1", "true", "yes")
+
+@functools.lru_cache(maxsize=None)
+def get_response_cache_db() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(GEMINI_CACHE_PATH), exist_ok=True)
+    # Autocommit; WAL lets concurrent eui runs read while another one writes.
+    db = sqlite3.connect(GEMINI_CACHE_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL)")
+    atexit.register(db.close)
+    return db
+
+def get_cached_response(key: str) -> Optional[str]:
+    if not gemini_cache_enabled():
+        return None
+    if key in _response_cache:
+        return _response_cache[key]
+    try:
+        with _response_cache_lock:
+            row = get_response_cache_db().execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read Gemini response cache entry {key}: {e}")
+        return None
+    if row is None:
+        return None
+    _response_cache[key] = row[0]
+    return row[0]
+
+def store_cached_response(key: str, content: str) -> None:
+    if not gemini_cache_enabled() or _response_cache.get(key) == content:
+        return
+    _response_cache[key] = content
+    try:
+        with _response_cache_lock:
+            get_response_cache_db().execute("INSERT OR REPLACE INTO responses (key, content) VALUES (?, ?)", (key, content))
+    except sqlite3.Error as e:
+        logger.warning(f"Could not write Gemini response cache entry {key}: {e}")
+
+@functools.lru_cache(maxsize=None)
+def get_pyright_command() -> tuple[str, ...]:
+    # Resolved once per process. Running the project venv's pyright directly skips the environment
+    # resolution `uv run` repeats on every type check; fall back to `uv run` when there is no venv.
+    for venv_bin in (os.path.join(".venv", "bin", "pyright"), os.path.join(".venv", "Scripts", "pyright.exe")):
+        pyright_path = os.path.join(PROJECT_ROOT, venv_bin)
+        if os.path.isfile(pyright_path) and os.access(pyright_path, os.X_OK):
+            return (pyright_path,)
+    return ("uv", "run", "pyright")
+
+class NonCodeResponseError(ValueError):
+    """Raised when a streamed response is abandoned because it does not look like code."""
+
+    def __init__(self, message: str, partial_response: str):
+        super().__init__(message)
+        self.partial_response = partial_response
+
+def stream_gemini_response(llm: ChatGoogleGenerativeAI, messages: list) -> str:
+    """Accumulates a streamed response, abandoning it early if its opening text is clearly not code
+    and stopping as soon as a fenced code block is closed."""
+    parts: list[str] = []
+    received = 0
+    checked = False
+    for chunk in llm.stream(messages):
+        if isinstance(chunk.content, str):
+            parts.append(chunk.content)
+            received += len(chunk.content)
+            if "`" in chunk.content: # Only chunks touching a fence can complete the code block
+                text = "".join(parts)
+                opening = text.find("```")
+                closing = text.find("\n```", opening + 3) if opening != -1 else -1
+                if closing != -1:
+                    # Anything after the closing fence is commentary the code cleanup would discard anyway.
+                    return text[:closing + 4]
+        if not checked and received >= STREAM_CODE_CHECK_CHARS:
+            checked = True
+            if not any(marker in "".join(parts) for marker in CODE_MARKERS):
+                # Leaving the loop closes the stream, so the rest of a refusal/explanation is never generated.
+                raise NonCodeResponseError(f"Response does not look like a Manim script; stopped streaming after {received} characters.", "".join(parts))
+    return "".join(parts)
+
+def stream_gemini_response_with_retry(llm: ChatGoogleGenerativeAI, messages: list) -> str:
+    """Runs stream_gemini_response, restarting the whole stream with exponential backoff on transient errors,
+    including ones raised mid-stream."""
+    attempt = 0
+    while True:
+        try:
+            return stream_gemini_response(llm, messages)
+        except RETRYABLE_GEMINI_ERRORS as e:
+            if attempt >= GEMINI_MAX_RETRIES:
+                raise
+            # Jittered so the scenes of a wave that hit a rate limit together don't retry in lockstep.
+            delay = min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            logger.warning(f"Transient Gemini error ({type(e).__name__}: {e}); retry {attempt}/{GEMINI_MAX_RETRIES} in {delay:.1f}s.")
+            time.sleep(delay)
+
+def format_pyright_diagnostics(diagnostics: list[dict]) -> str:
+    """Renders pyright --outputjson diagnostics as 'line:col - severity: message' lines."""
+    lines = []
+    for diagnostic in diagnostics:
+        start = diagnostic.get("range", {}).get("start", {})
+        rule = f" ({diagnostic['rule']})" if diagnostic.get("rule") else ""
+        lines.append(f"{start.get('line', 0) + 1}:{start.get('character', 0) + 1} - {diagnostic.get('severity', 'error')}: {diagnostic.get('message', '')}{rule}")
+    return "\n".join(lines)
+
+@functools.lru_cache(maxsize=None)
+def get_type_check_dir() -> str:
+    type_check_dir = tempfile.mkdtemp(prefix="manim_tc_")
+    atexit.register(shutil.rmtree, type_check_dir, ignore_errors=True)
+    return type_check_dir
+
+class TypeCheckBatcher:
+    """Coalesces type checks requested within a short window into one pyright run over all their files."""
+
+    def __init__(self, window_seconds: float = PYRIGHT_BATCH_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._pending: dict[str, list[concurrent.futures.Future]] = {}
+        self._timer: Optional[threading.Timer] = None
+
+    def check(self, script_path: str) -> tuple[bool, str]:
+        """Blocks until script_path has been checked; returns (passed, error output)."""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            self._pending.setdefault(os.path.realpath(script_path), []).append(future)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future.result()
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch, self._pending, self._timer = self._pending, {}, None
+
+        # Every future in the batch is resolved on every path; a caller left pending would block forever.
+        try:
+            results = self._run_pyright(list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        for script_path, futures in batch.items():
+            for future in futures:
+                future.set_result(results[script_path])
+
+    def _run_pyright(self, script_paths: list[str]) -> dict[str, tuple[bool, str]]:
+        command = [*get_pyright_command(), "--outputjson", *script_paths]
+        logger.info(f"Running type checker on {len(script_paths)} script(s): {shlex.join(command)}")
+        result = subprocess.run(command, capture_output=True, text=True, check=False, shell=False)
+        try:
+            diagnostics = json.loads(result.stdout).get("generalDiagnostics", [])
+        except (json.JSONDecodeError, AttributeError):
+            # Not pyright JSON (e.g. uv failed before pyright started): every file in the batch gets the raw output.
+            raw_output = (result.stderr + "\n\n#######################\n\n" + result.stdout).strip()
+            return {script_path: (result.returncode == 0, raw_output) for script_path in script_paths}
+
+        diagnostics_by_file: dict[str, list[dict]] = {}
+        for diagnostic in diagnostics:
+            diagnostics_by_file.setdefault(os.path.realpath(diagnostic.get("file", "")), []).append(diagnostic)
+        results = {}
+        for script_path in script_paths:
+            file_diagnostics = diagnostics_by_file.get(script_path, [])
+            if any(diagnostic.get("severity") == "error" for diagnostic in file_diagnostics):
+                results[script_path] = (False, format_pyright_diagnostics(file_diagnostics))
+            else:
+                results[script_path] = (True, "")
+        return results
+
+type_check_batcher = TypeCheckBatcher()
+
+def compact_previous_code(code: str) -> str:
+    """Drops blank and comment-only lines and keeps only the head and tail of long scripts, bounding context size."""
+    lines = [line for line in code.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    if len(lines) > PREVIOUS_CODE_HEAD_LINES + PREVIOUS_CODE_TAIL_LINES:
+        omitted = len(lines) - PREVIOUS_CODE_HEAD_LINES - PREVIOUS_CODE_TAIL_LINES
+        lines = lines[:PREVIOUS_CODE_HEAD_LINES] + [f"    # ... {omitted} lines omitted ..."] + lines[-PREVIOUS_CODE_TAIL_LINES:]
+    return "\n".join(lines)
 
 class ManimScriptGenerationState(TypedDict):
+    scene_identifier: str
+    scene_index: int # Position in script.json; unique per scene, unlike the LLM-written scene_number
     animation_description: str
     previous_code: Optional[str]
     constructed_prompt: Optional[str]
@@ -38,6 +357,12 @@ class ManimScriptGenerationState(TypedDict):
     type_check_error_output: Optional[str]
     class_definitions_for_context: Optional[str]
     current_retry_attempt: int
+    response_cache_key: Optional[str]
+
+@functools.lru_cache(maxsize=2048)
+def _cached_class_info(mtime_ns: int, class_name: str) -> str:
+    # Keyed on the file's mtime so an edited class_methods.txt is re-read rather than served stale.
+    return extract_class_info_from_file(CLASS_METHODS_FILE_PATH, class_name)
 
 def get_class_definitions_for_context(pyright_error_output: str, logger_instance: logging.Logger) -> str:
     with log_node_ctx(logger_instance, "get_class_definitions_for_context"):
@@ -45,19 +370,19 @@ def get_class_definitions_for_context(pyright_error_output: str, logger_instance
             logger_instance.warning(f"Class methods file not found at {CLASS_METHODS_FILE_PATH}. Cannot extract class definitions.")
             return ""
 
-        class_names_found: Set[str] = set(re.findall(r'for class "([^"]+)"', pyright_error_output, re.IGNORECASE))
-        class_names_found.update(set(re.findall(r'class "([^"]+)"', pyright_error_output, re.IGNORECASE)))
+        class_names_found: Set[str] = set(_CLASS_NAME_RE.findall(pyright_error_output))
         
         if not class_names_found:
             logger_instance.info("No specific class names found in Pyright error output to look up.")
             return ""
 
         logger_instance.info(f"Found potential class names in errors: {class_names_found}")
+        class_methods_mtime_ns = os.stat(CLASS_METHODS_FILE_PATH).st_mtime_ns
         definitions_text_parts = []
         for class_name in class_names_found:
             try:
                 logger_instance.info(f"Attempting to extract definition for class: {class_name} from {CLASS_METHODS_FILE_PATH}")
-                class_info = extract_class_info_from_file(CLASS_METHODS_FILE_PATH, class_name)
+                class_info = _cached_class_info(class_methods_mtime_ns, class_name)
                 if class_info:
                     definitions_text_parts.append(f"Definition for class '{class_name}':\n```python\n{class_info}\n```\n")
                     logger_instance.info(f"Successfully extracted definition for {class_name}.")
@@ -84,67 +409,22 @@ def prepare_prompt_node(state: ManimScriptGenerationState) -> dict:
 
         if type_check_feedback and current_attempt_script:
             logger.info(f"Retrying with type check feedback. Attempt: {state.get('current_retry_attempt', 0)}")
-            context_prompt_parts.append(f"""
-#####################################################
-The following code was generated for the current animation description ('{animation_description}')
-but failed static type checking:
-
-Problematic Code:
-'''python
-{current_attempt_script}
-'''
-
-Static Type Checker Output (Errors):
-'''
-{type_check_feedback}
-'''
-""")
+            context_prompt_parts.append(TYPE_CHECK_FEEDBACK_TEMPLATE.format(
+                current_attempt_script=current_attempt_script,
+                type_check_feedback=type_check_feedback,
+            ))
             if class_definitions_context:
                 context_prompt_parts.append(class_definitions_context)
-            
-            context_prompt_parts.append(f"""
-Please analyze these errors and the provided class definitions (if any) and provide a corrected Manim script.
-Ensure the new script is complete, runnable, and addresses these type errors.
-The original animation description is: "{animation_description}"
-#####################################################""")
+            context_prompt_parts.append(RETRY_INSTRUCTIONS)
 
         elif previous_item_code:
-            context_prompt_parts.append(f"""
-#####################################################
-Context from a previously generated animation scene (if available):
-Previous Code:
-'''python
-{previous_item_code}
-'''
-#####################################################""")
-
-        context_prompt_parts.append(f"""
-#####################################################
-Common Errors to avoid (Review these carefully):
-{COMMON_ERROR_CONTENT}
-#####################################################""")
-
-        final_context_prompt = "\n".join(context_prompt_parts)
-
-        prompt = f"""
-#####################################################
-Generate a complete, runnable Manim Python script for the
-following animation description. The script should be a single scene
-class that inherits from Scene or a relevant Manim base Scene class (e.g., MovingCameraScene, ZoomedScene). 
-Do not include any explanation, just the code inside a single python code block.
-Optimized for youtube shorts; Keep animations at the center;
-No code diffes that are too big. Always use simple shapes.
-{final_context_prompt}
-#####################################################
-
-#####################################################
-Current Animation Description:
-{animation_description}
-#####################################################
+            context_prompt_parts.append(PREVIOUS_CODE_TEMPLATE.format(previous_item_code=compact_previous_code(previous_item_code)))
 
-make sure the old and new verison have coharance;
-the old COULD BE the starting point for the new scean if present. ALSO NOT DEPENDS ON YOU.
-"""
+        # Only the per-scene content goes here; the fixed instructions are sent as the system prompt.
+        prompt = SCENE_PROMPT_TEMPLATE.format(
+            final_context_prompt="\n".join(context_prompt_parts),
+            animation_description=animation_description,
+        )
         return {"constructed_prompt": prompt, "type_check_error_output": None, "class_definitions_for_context": None}
 
 def call_gemini_node(state: ManimScriptGenerationState) -> dict:
@@ -165,34 +445,35 @@ def call_gemini_node(state: ManimScriptGenerationState) -> dict:
             model_name_for_langchain = RETRY_MODEL_NAME
             logger.info(f"Using Retry Gemini model: {model_name_for_langchain}")
         
-        llm = ChatGoogleGenerativeAI(model=model_name_for_langchain)
+        system_prompt = get_system_prompt()
+        cache_key = response_cache_key(model_name_for_langchain, system_prompt + prompt)
+        generated_code = get_cached_response(cache_key)
+        if generated_code is not None:
+            logger.info(f"Using cached Gemini response for animation: {state['animation_description'][:70]}...")
 
-        logger.info(f"Attempting Gemini API call for animation: {state['animation_description'][:70]}...")
         try:
-            response_message = llm.invoke(prompt)
-            generated_code = response_message.content
+            if generated_code is None:
+                logger.info(f"Attempting Gemini API call for animation: {state['animation_description'][:70]}...")
+                generated_code = stream_gemini_response_with_retry(get_llm(model_name_for_langchain), [("system", system_prompt), ("human", prompt)])
 
             if isinstance(generated_code, str):
-                cleaned_code = generated_code.strip()
-                if cleaned_code.startswith("```python"):
-                    cleaned_code = cleaned_code[len("```python"):].strip()
-                elif cleaned_code.startswith("```"):
-                    cleaned_code = cleaned_code[3:].strip()
-
-                if cleaned_code.endswith("```"):
-                    cleaned_code = cleaned_code[:-3].strip()
-
-                if cleaned_code.lower().startswith("python\n"):
-                    cleaned_code = cleaned_code[len("python\n"):].lstrip()
-                elif cleaned_code.lower().startswith("python "):
-                     cleaned_code = cleaned_code[len("python "):].lstrip()
-
-                return {"generated_script": cleaned_code.strip(), "error_message": None}
+                cleaned_code = _CODE_FENCE_RE.match(generated_code).group(1).strip()
+                # Cached by static_type_check_node only once the script passes, so failed attempts are regenerated on reruns.
+                return {"generated_script": cleaned_code, "error_message": None, "response_cache_key": cache_key}
             else:
                 error_msg = f"Unexpected response content type from LLM: {type(generated_code)}"
                 logger.error(error_msg)
                 return {"error_message": error_msg, "generated_script": None}
 
+        except NonCodeResponseError as e:
+            # Not fatal: static_type_check_node counts it as a failed attempt, so the scene is retried with feedback.
+            logger.warning(f"{e} Retrying with feedback.")
+            return {
+                "generated_script": e.partial_response,
+                "type_check_error_output": f"{e} The reply must be only a complete Manim Python script in a single python code block.",
+                "error_message": None,
+                "response_cache_key": None
+            }
         except Exception as e:
             error_msg = f"Error calling Gemini or processing response via Langchain: {e}"
             logger.error(error_msg, exc_info=True)
@@ -209,50 +490,53 @@ def static_type_check_node(state: ManimScriptGenerationState) -> dict:
             logger.warning("No script generated to type check.")
             return {
                 "error_message": state.get("error_message", "No script available for type checking."),
-                "type_check_error_output": None,
-                "class_definitions_for_context": None,
-                "current_retry_attempt": current_attempt
+                "type_check_error_output": None
             }
 
-        try:
-            with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False, encoding='utf-8') as tmp_script:
-                tmp_script.write(script_to_check)
-                tmp_script_path = tmp_script.name
+        if state.get("type_check_error_output"):
+            # call_gemini_node already rejected this response as not being code; don't type check it.
+            return {"current_retry_attempt": current_attempt + 1}
 
-            command = ["uv", "run", "pyright", tmp_script_path]
-            logger.info(f"Running type checker: {' '.join(command)}")
+        # Syntax errors are caught by Python's own parser in microseconds; don't spend a pyright run on them.
+        try:
+            ast.parse(script_to_check)
+        except SyntaxError as e:
+            error_output = f"{e.lineno}:{e.offset or 1} - error: SyntaxError: {e.msg}"
+            if e.text:
+                error_output += f"\n    {e.text.rstrip()}"
+            logger.warning(f"Generated script does not parse, skipping pyright: {e.msg} (line {e.lineno})")
+            return {"type_check_error_output": error_output, "current_retry_attempt": current_attempt + 1}
 
-            result = subprocess.run(command, capture_output=True, text=True, check=False, shell=False)
+        try:
+            # Retries of a scene overwrite the same file; the directory is removed at interpreter exit.
+            scene_index = state.get("scene_index")
+            scene_id = scene_index if scene_index is not None else f"t{threading.get_ident()}"
+            tmp_script_path = os.path.join(get_type_check_dir(), f"scene_{scene_id}.py")
+            with open(tmp_script_path, "w", encoding="utf-8") as tmp_script:
+                tmp_script.write(script_to_check)
 
-            os.remove(tmp_script_path)
+            # Concurrent scenes in a wave share one pyright process via the batcher.
+            passed, error_output = type_check_batcher.check(tmp_script_path)
 
-            if result.returncode == 0:
+            if passed:
                 logger.info("Type check successful.")
-                return {
-                    "generated_script": script_to_check,
-                    "type_check_error_output": None,
-                    "class_definitions_for_context": None,
-                    "current_retry_attempt": current_attempt,
-                    "error_message": None
-                }
+                if state.get("response_cache_key"):
+                    store_cached_response(state["response_cache_key"], script_to_check)
+                return {"type_check_error_output": None, "error_message": None}
             else:
-                error_output = (result.stderr + "\n\n#######################\n\n" + result.stdout).strip()
-                logger.warning(f"Type check failed with status code {result.returncode}.")
+                logger.warning("Type check failed.")
                 class_definitions_for_retry = get_class_definitions_for_context(error_output, logger)
                 
                 return {
-                    "generated_script": script_to_check,
                     "type_check_error_output": (error_output or "Type checker returned an error but no output."),
                     "class_definitions_for_context": class_definitions_for_retry,
-                    "current_retry_attempt": current_attempt + 1,
-                    "error_message": None 
+                    "current_retry_attempt": current_attempt + 1
                 }
         except FileNotFoundError:
             error_msg = "Error: 'uv' or 'pyright' command not found. Make sure it's installed and in your PATH."
             logger.error(error_msg)
             class_definitions_for_retry = get_class_definitions_for_context(error_msg, logger) if script_to_check else None
             return {
-                "generated_script": script_to_check,
                 "error_message": error_msg,
                 "type_check_error_output": error_msg,
                 "class_definitions_for_context": class_definitions_for_retry,
@@ -263,7 +547,6 @@ def static_type_check_node(state: ManimScriptGenerationState) -> dict:
             logger.error(error_msg, exc_info=True)
             class_definitions_for_retry = get_class_definitions_for_context(error_msg, logger) if script_to_check else None
             return {
-                "generated_script": script_to_check,
                 "error_message": error_msg,
                 "type_check_error_output": error_msg,
                 "class_definitions_for_context": class_definitions_for_retry,
@@ -309,27 +592,78 @@ workflow.add_conditional_edges(
 
 manim_script_agent = workflow.compile()
 
-def generate_manim_code_from_script(script_json_path: str, output_code_md_path: str):
+def load_successful_scenes(code_md_path: str) -> dict[str, str]:
+    """Maps animation description -> code for every scene an existing code.md records as successful."""
+    try:
+        with open(code_md_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return {}
+    scenes = {}
+    for match in _SUCCESSFUL_SCENE_RE.finditer(content):
+        description, code = match.group(1), match.group(2)
+        # The markdown can't be parsed back unambiguously (a script may itself contain a closing fence line),
+        # so only code that still parses is reused; anything else is generated again.
+        try:
+            ast.parse(code)
+        except SyntaxError:
+            logger.warning(f"Not reusing the recorded code for '{description[:70]}...' from {code_md_path}: it no longer parses.")
+            continue
+        scenes[description] = code
+    return scenes
+
+
+def prepare_scenes(script_data: list, script_json_path: str) -> list[tuple[int, str, str]]:
+    """Validates the script items up front. Returns (index, scene_identifier, animation_description) per usable scene."""
+    scenes = []
+    for index, item in enumerate(script_data):
+        if not isinstance(item, dict):
+            logger.warning(f"Item {index + 1} in {script_json_path} is not a dictionary. Skipping.")
+            continue
+        animation_description = item.get("animation-description")
+        if not animation_description or not isinstance(animation_description, str):
+            logger.warning(f"No 'animation-description' found for item {index + 1} in {script_json_path}.")
+            continue
+        # 'scene_number' is optional in the script; fall back to the item's position.
+        scenes.append((index, str(item.get("scene_number", index + 1)), animation_description))
+    return scenes
+
+
+def generate_manim_code_from_script(script_json_path: str, output_code_md_path: str, script_data: Optional[list] = None, scene_concurrency: Optional[int] = None, resume: bool = True):
     """
     Generates Manim Python code from a script JSON file and writes it to a Markdown file.
 
     Args:
         script_json_path: Path to the input script JSON file.
         output_code_md_path: Path to the output Markdown file for the generated code.
+        script_data: Already-parsed contents of script_json_path. Read from disk when None.
+        scene_concurrency: Scenes generated concurrently per wave after the first scene, which is always generated
+            on its own so every later wave has its code as a style reference (default SCENE_WAVE_SIZE). 1 restores
+            strictly sequential generation where every scene sees the previous scene's code; larger values trade
+            that scene-to-scene coherence for throughput.
+        resume: Reuse the code of scenes that an existing output_code_md_path already records as successful
+            (matched by animation description) instead of generating them again.
     """
+    wave_size = scene_concurrency if scene_concurrency is not None else SCENE_WAVE_SIZE
+    if wave_size < 1:
+        raise ValueError(f"scene_concurrency must be at least 1, got {scene_concurrency}.")
+
     # Ensure output directory exists
     output_dir = os.path.dirname(output_code_md_path)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         logger.info(f"Created output directory: {output_dir}")
 
-    with open(output_code_md_path, 'w', encoding='utf-8') as md_file:
-        md_file.write("# Generated Manim Code (with Type Checking)\n\n")
-        md_file.write(f"This file contains Manim Python code snippets generated based on animation descriptions. Each script attempts to pass static type checking up to {MAX_TYPE_CHECK_RETRIES} retries.\n\n")
+    # Read before the file is rewritten below.
+    resumed_scripts = load_successful_scenes(output_code_md_path) if resume else {}
+    if resumed_scripts:
+        logger.info(f"Found {len(resumed_scripts)} successfully generated scene(s) in {output_code_md_path}; they will be reused.")
 
     try:
-        with open(script_json_path, 'r', encoding='utf-8') as f:
-            script_data = json.load(f)
+        if script_data is None:
+            with open(script_json_path, 'rb') as f:
+                raw_script = f.read()
+            script_data = load_json_bytes(raw_script)
     except FileNotFoundError:
         logger.error(f"The script file {script_json_path} was not found.")
         return False # Indicate failure
@@ -337,81 +671,117 @@ def generate_manim_code_from_script(script_json_path: str, output_code_md_path:
         logger.error(f"Could not decode JSON from {script_json_path}.")
         return False # Indicate failure
 
-    previous_code_for_context = ""
-    all_successful = True
-
-    with open(output_code_md_path, 'a', encoding='utf-8') as md_file:
-        for index, item in enumerate(script_data):
-            animation_description = item.get("animation-description")
-            # In the original script, 'scene_number' was part of the item, but here we use 'index'
-            # If 'scene_number' is crucial, the input JSON structure or processing needs adjustment.
-            # For now, using (index + 1) as scene identifier.
-            scene_identifier = item.get("scene_number", index + 1)
-
-            if animation_description:
-                logger.info(f"\nProcessing animation description for scene {scene_identifier} ({index + 1}/{len(script_data)}) with LangGraph agent...")
-
-                agent_input = ManimScriptGenerationState(
-                    animation_description=animation_description,
-                    previous_code=previous_code_for_context,
-                    constructed_prompt=None,
-                    generated_script=None,
-                    error_message=None,
-                    type_check_error_output=None,
-                    class_definitions_for_context=None,
-                    current_retry_attempt=0
-                )
-
-                final_state = manim_script_agent.invoke(agent_input)
-
-                python_code = final_state.get("generated_script")
-                agent_llm_error = final_state.get("error_message")
-                final_type_check_error = final_state.get("type_check_error_output")
-
-                md_file.write(f"### Animation Scene {scene_identifier}\n")
-                md_file.write(f"**Description:** {animation_description}\n\n")
-
-                if agent_llm_error:
-                    logger.error(f"Agent returned a critical error for scene {scene_identifier}: {agent_llm_error}")
-                    md_file.write(f"**Status:** Generation failed due to agent error.\n\n")
-                    md_file.write("```text\n")
-                    md_file.write(f"# Error from Agent: {agent_llm_error}\n")
-                    md_file.write("```\n\n")
-                    previous_code_for_context = ""
-                    all_successful = False
-                elif final_type_check_error and python_code:
-                    logger.warning(f"Script for scene {scene_identifier} FAILED static type checking after {final_state.get('current_retry_attempt', MAX_TYPE_CHECK_RETRIES+1)-1} retries.")
-                    md_file.write(f"**Status:** Generated, but FAILED static type checking after {final_state.get('current_retry_attempt', MAX_TYPE_CHECK_RETRIES+1)-1} retries.\n\n")
-                    md_file.write("```python\n")
-                    md_file.write(f"# Original animation description: {animation_description}\n")
-                    md_file.write(f"# SCRIPT FAILED TYPE CHECKING. LAST ATTEMPT:\n\n")
-                    md_file.write(python_code)
-                    md_file.write(f"\n\n# --- PYRIGHT ERRORS (from last attempt) ---\n# ")
-                    md_file.write("\n# ".join(final_type_check_error.splitlines()))
-                    md_file.write("\n# --- END PYRIGHT ERRORS ---")
-                    md_file.write("\n```\n\n")
-                    previous_code_for_context = python_code # Still provide for context, even if failed
-                    all_successful = False # Mark overall as not fully successful
-                elif python_code:
-                    logger.info(f"Script for scene '{scene_identifier}' ('{animation_description[:70]}...') generated successfully (passed type checks).")
-                    md_file.write(f"**Status:** Generation successful (passed type checks).\n\n")
-                    md_file.write("```python\n")
-                    md_file.write(python_code)
-                    md_file.write("\n```\n\n")
-                    previous_code_for_context = python_code
-                else:
-                    logger.error(f"Agent did not return a script for scene {scene_identifier} ('{animation_description[:70]}...') and no explicit error message was set in final state.")
-                    md_file.write(f"**Status:** Generation failed (no script produced, no specific error).\n\n")
-                    md_file.write("```text\n")
-                    md_file.write("# Error: No script generated by agent and no specific error message in final state.\n")
-                    md_file.write("```\n\n")
-                    previous_code_for_context = ""
-                    all_successful = False
-
-                logger.info(f"Appended result for scene {scene_identifier} to {output_code_md_path}")
-            else:
-                logger.warning(f"No 'animation-description' found for item {index + 1} in {script_json_path}.")
-                all_successful = False # Missing description is a form of failure for this item
+    # One handle for the header and every scene; the large buffer turns per-scene writes into a few syscalls.
+    # Written next to the output and swapped in only once complete, so an interrupted run leaves the previous
+    # code.md (and the scenes a later run can resume from) intact.
+    tmp_code_md_path = f"{output_code_md_path}.tmp"
+    try:
+        with open(tmp_code_md_path, 'w', encoding='utf-8', buffering=1 << 20) as md_file:
+            md_file.write(
+                "# Generated Manim Code (with Type Checking)\n\n"
+                f"This file contains Manim Python code snippets generated based on animation descriptions. Each script attempts to pass static type checking up to {MAX_TYPE_CHECK_RETRIES} retries.\n\n"
+            )
+
+            scenes = prepare_scenes(script_data, script_json_path)
+            logger.info(f"{len(scenes)}/{len(script_data)} scenes queued for generation.")
+
+            previous_code_for_context = ""
+            anchor_code = "" # First successful script; the context whenever the previous wave produced none
+            all_successful = len(scenes) == len(script_data) # A skipped item is a form of failure
+
+            # Scenes are generated in waves: the first scene alone, then wave_size at a time. The LLM calls within a
+            # wave run concurrently and all share the previous wave's last script as context (or the first successful
+            # script if that wave produced none), then results are written in scene order.
+            # Scenes with an identical animation description are generated once and share the result.
+            final_state_by_description: dict[str, dict] = {
+                description: {"generated_script": code} for description, code in resumed_scripts.items()
+            }
+            scene_iter = iter(scenes)
+            wave_sizes = itertools.chain([1], itertools.repeat(wave_size))
+            while wave := list(itertools.islice(scene_iter, next(wave_sizes))):
+                agent_inputs = []
+                wave_descriptions: list[str] = []
+                for index, scene_identifier, animation_description in wave:
+                    if animation_description in resumed_scripts:
+                        logger.info(f"Scene {scene_identifier} was already generated successfully; reusing its code from {output_code_md_path}.")
+                        continue
+                    if animation_description in final_state_by_description or animation_description in wave_descriptions:
+                        logger.info(f"Scene {scene_identifier} repeats an earlier animation description; reusing its generated code.")
+                        continue
+                    wave_descriptions.append(animation_description)
+                    logger.info(f"\nProcessing animation description for scene {scene_identifier} ({index + 1}/{len(script_data)}) with LangGraph agent...")
+                    agent_inputs.append(ManimScriptGenerationState(
+                        scene_identifier=scene_identifier,
+                        scene_index=index,
+                        animation_description=animation_description,
+                        previous_code=previous_code_for_context or anchor_code,
+                        constructed_prompt=None,
+                        generated_script=None,
+                        error_message=None,
+                        type_check_error_output=None,
+                        class_definitions_for_context=None,
+                        current_retry_attempt=0,
+                        response_cache_key=None
+                    ))
+
+                if agent_inputs:
+                    final_state_by_description.update(zip(wave_descriptions, manim_script_agent.batch(agent_inputs, config={"max_concurrency": wave_size})))
+
+                for _, scene_identifier, animation_description in wave:
+                    final_state = final_state_by_description[animation_description]
+
+                    python_code = final_state.get("generated_script")
+                    agent_llm_error = final_state.get("error_message")
+                    final_type_check_error = final_state.get("type_check_error_output")
+
+                    # Each scene's markdown is assembled in memory and written with a single call.
+                    header = f"### Animation Scene {scene_identifier}\n**Description:** {animation_description}\n\n"
+
+                    if agent_llm_error:
+                        logger.error(f"Agent returned a critical error for scene {scene_identifier}: {agent_llm_error}")
+                        body = (
+                            "**Status:** Generation failed due to agent error.\n\n"
+                            f"```text\n# Error from Agent: {agent_llm_error}\n```\n\n"
+                        )
+                        previous_code_for_context = ""
+                        all_successful = False
+                    elif final_type_check_error and python_code:
+                        retries_made = final_state.get('current_retry_attempt', MAX_TYPE_CHECK_RETRIES+1)-1
+                        logger.warning(f"Script for scene {scene_identifier} FAILED static type checking after {retries_made} retries.")
+                        pyright_errors = "\n# ".join(final_type_check_error.splitlines())
+                        body = (
+                            f"**Status:** Generated, but FAILED static type checking after {retries_made} retries.\n\n"
+                            "```python\n"
+                            f"# Original animation description: {animation_description}\n"
+                            "# SCRIPT FAILED TYPE CHECKING. LAST ATTEMPT:\n\n"
+                            f"{python_code}"
+                            f"\n\n# --- PYRIGHT ERRORS (from last attempt) ---\n# {pyright_errors}"
+                            "\n# --- END PYRIGHT ERRORS ---"
+                            "\n```\n\n"
+                        )
+                        previous_code_for_context = python_code # Still provide for context, even if failed
+                        all_successful = False # Mark overall as not fully successful
+                    elif python_code:
+                        logger.info(f"Script for scene '{scene_identifier}' ('{animation_description[:70]}...') generated successfully (passed type checks).")
+                        body = f"**Status:** Generation successful (passed type checks).\n\n```python\n{python_code}\n```\n\n"
+                        previous_code_for_context = python_code
+                        anchor_code = anchor_code or python_code
+                    else:
+                        logger.error(f"Agent did not return a script for scene {scene_identifier} ('{animation_description[:70]}...') and no explicit error message was set in final state.")
+                        body = (
+                            "**Status:** Generation failed (no script produced, no specific error).\n\n"
+                            "```text\n# Error: No script generated by agent and no specific error message in final state.\n```\n\n"
+                        )
+                        previous_code_for_context = ""
+                        all_successful = False
+
+                    md_file.write(header + body)
+
+                    logger.info(f"Appended result for scene {scene_identifier} to {output_code_md_path}")
+        os.replace(tmp_code_md_path, output_code_md_path)
+    finally:
+        if os.path.exists(tmp_code_md_path):
+            os.remove(tmp_code_md_path)
 
     logger.info(f"\nProcessing complete. Manim Python code snippets (with type checking attempts) appended to {output_code_md_path}")
     return all_successful
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import json
+import functools
 import argparse
 import logging
 from typing import TypedDict, List as PyList, Optional
@@ -11,11 +12,14 @@ from langchain_core.output_parsers import StrOutputParser
 from langgraph.graph import StateGraph, END
 
 from ..utils.custom_logging import setup_custom_logging, log_node_ctx
+from ..utils.json_utils import load_json_bytes
 
 logger = setup_custom_logging(logger_name="ScriptGenerator")
 
 VIDEO_PROMPT_FILE = os.path.join(os.getcwd(), "prompts", "generate_video_prompt.md")
 DEFAULT_OUTPUT_SCRIPT_FILE = os.path.join(os.getcwd(), "script.json")
+SCRIPT_MODEL_NAME = "gemini-2.5-pro-preview-06-05"
+EXPECTED_SCRIPT_ITEM_KEYS = frozenset({"music-description", "speech", "animation-description", "duration"})
 
 
 class ScriptGenerationState(TypedDict):
@@ -26,49 +30,62 @@ class ScriptGenerationState(TypedDict):
     error_message: Optional[str]
 
 
-def load_video_prompt_template(state: ScriptGenerationState) -> ScriptGenerationState:
+@functools.lru_cache(maxsize=None)
+def get_llm() -> ChatGoogleGenerativeAI:
+    # Built once per process instead of on every graph run.
+    return ChatGoogleGenerativeAI(model=SCRIPT_MODEL_NAME, temperature=0.7)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_video_prompt_template(path: str, mtime_ns: int) -> str:
+    # Cached per (path, mtime), so repeated runs in one process skip the read and trimming until the file changes.
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    example_marker = "example output"
+    if example_marker in content.lower():
+        content = content.split(example_marker)[0].strip()
+
+    lines = content.splitlines()
+    if lines and "make a yt-short on the topic" in lines[0].lower():
+        content = "\n".join(lines[1:]).strip()
+    return content
+
+
+def load_video_prompt_template(state: ScriptGenerationState) -> dict:
     with log_node_ctx(logger, "load_video_prompt_template"):
         logger.info(f"Loading Video Prompt Template from: {VIDEO_PROMPT_FILE}")
         try:
-            with open(VIDEO_PROMPT_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            example_marker = "example output"
-            if example_marker in content.lower():
-                content = content.split(example_marker)[0].strip()
-
-            lines = content.splitlines()
-            if lines and "make a yt-short on the topic" in lines[0].lower():
-                content = "\n".join(lines[1:]).strip()
+            content = _read_video_prompt_template(VIDEO_PROMPT_FILE, os.stat(VIDEO_PROMPT_FILE).st_mtime_ns)
 
             if not content:
                 error_msg = f"Video prompt template file '{VIDEO_PROMPT_FILE}' is empty or relevant content is missing."
                 logger.error(error_msg)
-                return {**state, "error_message": error_msg, "video_prompt_template_content": ""}
+                return {"error_message": error_msg, "video_prompt_template_content": ""}
 
             logger.info("Successfully loaded video prompt template content.")
-            return {**state, "video_prompt_template_content": content, "error_message": None}
+            return {"video_prompt_template_content": content, "error_message": None}
         except FileNotFoundError:
             error_msg = f"Video prompt template file '{VIDEO_PROMPT_FILE}' not found."
             logger.error(error_msg)
-            return {**state, "error_message": error_msg, "video_prompt_template_content": ""}
+            return {"error_message": error_msg, "video_prompt_template_content": ""}
         except Exception as e:
             error_msg = f"Error loading video prompt template: {str(e)}"
             logger.error(error_msg)
-            return {**state, "error_message": error_msg, "video_prompt_template_content": ""}
+            return {"error_message": error_msg, "video_prompt_template_content": ""}
 
 
-def generate_script(state: ScriptGenerationState) -> ScriptGenerationState:
+def generate_script(state: ScriptGenerationState) -> dict:
     with log_node_ctx(logger, "generate_script"): # Use log_node_ctx with logger
         logger.info("Generating Video Script...")
         if state.get("error_message") or not state.get("video_prompt_template_content"):
             logger.warning("Skipping script generation due to previous error or missing prompt content.")
-            return state
+            return {}
 
         topic = state["topic"]
         video_prompt_template_content = state["video_prompt_template_content"]
 
-        llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro-preview-06-05", temperature=0.7)
+        llm = get_llm()
 
         json_exp = '''{{
 		"music-description": "<replace>",
@@ -117,37 +134,33 @@ def generate_script(state: ScriptGenerationState) -> ScriptGenerationState:
                 "video_prompt_template_content": video_prompt_template_content
             })
             logger.info("Gemini Response Received.")
-            return {**state, "generated_script_str": generated_script_str.strip(), "error_message": None}
+            return {"generated_script_str": generated_script_str.strip(), "error_message": None}
         except Exception as e:
             error_msg = f"Error during Gemini API call: {str(e)}"
             logger.error(error_msg)
-            return {**state, "generated_script_str": None, "error_message": error_msg}
+            return {"generated_script_str": None, "error_message": error_msg}
 
 
-def parse_and_validate_script(state: ScriptGenerationState) -> ScriptGenerationState:
+def parse_and_validate_script(state: ScriptGenerationState) -> dict:
     with log_node_ctx(logger, "parse_and_validate_script"): # Use log_node_ctx with logger
         logger.info("Parsing and Validating Script...")
         if state.get("error_message") or not state.get("generated_script_str"):
             logger.warning("Skipping parsing due to previous error or no script generated.")
-            return state
+            return {}
 
         script_str = state["generated_script_str"]
         if not script_str:
             error_msg = "No script content received from generation step."
             logger.error(error_msg)
-            return {**state, "parsed_script": None, "error_message": error_msg}
+            return {"parsed_script": None, "error_message": error_msg}
 
         try:
-            if script_str.startswith("```json"):
-                script_str = script_str[7:]
-                if script_str.endswith("```"):
-                    script_str = script_str[:-3]
-            script_str = script_str.strip()
+            script_str = script_str.removeprefix("```json").removesuffix("```").strip()
 
             if not script_str.startswith("[") or not script_str.endswith("]"):
                 raise ValueError("Generated script does not appear to be a JSON list (missing '[' or ']').")
 
-            parsed_json = json.loads(script_str)
+            parsed_json = load_json_bytes(script_str)
 
             if not isinstance(parsed_json, PyList):
                 raise ValueError("Generated script is not a JSON list after parsing.")
@@ -158,28 +171,27 @@ def parse_and_validate_script(state: ScriptGenerationState) -> ScriptGenerationS
             for i, item in enumerate(parsed_json):
                 if not isinstance(item, dict):
                     raise ValueError(f"Item {i+1} in the script is not a dictionary.")
-                expected_keys = {"music-description", "speech", "animation-description", "duration"}
-                actual_keys = set(item.keys())
-                if not expected_keys.issubset(actual_keys):
-                    missing_keys = expected_keys - actual_keys
-                    extra_keys = actual_keys - expected_keys
+                if not EXPECTED_SCRIPT_ITEM_KEYS.issubset(item):
+                    actual_keys = set(item.keys())
+                    missing_keys = EXPECTED_SCRIPT_ITEM_KEYS - actual_keys
+                    extra_keys = actual_keys - EXPECTED_SCRIPT_ITEM_KEYS
                     error_detail = f"Item {i+1} is malformed. Missing: {missing_keys if missing_keys else 'None'}. Unexpected: {extra_keys if extra_keys else 'None'}."
                     raise ValueError(error_detail)
 
             logger.info(f"Successfully parsed and validated script with {len(parsed_json)} items.")
-            return {**state, "parsed_script": parsed_json, "error_message": None}
+            return {"parsed_script": parsed_json, "error_message": None}
         except json.JSONDecodeError as e:
             error_msg = f"Failed to decode JSON from LLM output: {str(e)}. \nProblematic output snippet (first 500 chars):\n'{script_str[:500]}...'"
             logger.error(error_msg)
-            return {**state, "parsed_script": None, "error_message": error_msg}
+            return {"parsed_script": None, "error_message": error_msg}
         except ValueError as e:
             error_msg = f"Validation error in generated script: {str(e)}. \nProblematic output snippet (first 500 chars):\n'{script_str[:500]}...'"
             logger.error(error_msg)
-            return {**state, "parsed_script": None, "error_message": error_msg}
+            return {"parsed_script": None, "error_message": error_msg}
         except Exception as e:
             error_msg = f"Unexpected error during script parsing/validation: {str(e)}. \nProblematic output snippet (first 500 chars):\n'{script_str[:500]}...'"
             logger.error(error_msg)
-            return {**state, "parsed_script": None, "error_message": error_msg}
+            return {"parsed_script": None, "error_message": error_msg}
 
 
 workflow = StateGraph(ScriptGenerationState)
@@ -2,54 +2,137 @@ import torchaudio as ta
 import torch
 from chatterbox.tts import ChatterboxTTS
 import argparse
+import json
 import sys
 import os
 
-def main():
-    parser = argparse.ArgumentParser(description="Generate audio from text using ChatterboxTTS.")
-    parser.add_argument("input_text", type=str, help="The text to synthesize.")
-    parser.add_argument("output_path", type=str, help="The file path to save the generated audio.")
-    args = parser.parse_args()
+def configure_cuda():
+    # Pin the device and let cuDNN/matmul pick faster kernels (autotuned convs, TF32 on Ampere+).
+    torch.cuda.set_device(0)
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
 
+def detect_device():
     # Automatically detect the best available device
     if torch.cuda.is_available():
-        device = "cuda"
+        configure_cuda()
+        return "cuda"
     elif torch.backends.mps.is_available(): # For Apple Silicon
-        device = "mps"
-    else:
-        device = "cpu"
+        return "mps"
+    return "cpu"
 
-    print(f"Using device: {device}")
+def find_target_voice():
     try:
         target_voice = os.path.join(os.getcwd(), "voice_sample.mp3")
         open(target_voice)
     except Exception as e:
         target_voice = None
+    return target_voice
+
+def get_autocast_dtype(device):
+    # Reduced precision for the T3 token generation; CPU stays in fp32. bf16 only where the GPU runs it natively
+    # (Ampere+); on e.g. T4/V100 it is emulated and slower than fp16.
+    if device == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported(including_emulation=False) else torch.float16
+    if device == "mps":
+        return torch.float16
+    return None
+
+def autocast_t3(model, device):
+    """Runs T3 token generation under autocast, leaving the S3Gen/HiFiGAN vocoder (stft/istft) in fp32."""
+    autocast_dtype = get_autocast_dtype(device)
+    if autocast_dtype is None:
+        return
+    t3_inference = model.t3.inference
+
+    def t3_inference_with_autocast(*args, **kwargs):
+        with torch.autocast(device_type=device, dtype=autocast_dtype):
+            return t3_inference(*args, **kwargs)
 
+    model.t3.inference = t3_inference_with_autocast
+
+def load_model(device):
     try:
         model = ChatterboxTTS.from_pretrained(device=device)
     except Exception as e:
         print(f"Error loading model: {e}")
         sys.exit(1)
 
-    text_to_synthesize = args.input_text
-    output_file_path = args.output_path
-
-    if not output_file_path:
-        print("Error: Output file path must be provided.")
-        sys.exit(1)
+    if device == "cuda":
+        # T3.inference drives its Llama backbone (t3.tfmr) once per generated token; compiling T3 itself would
+        # only cover T3.forward, which inference never calls. dynamic=True because the KV cache grows every step.
+        # The compile cost is amortized over all jobs served by the worker.
+        try:
+            model.t3.tfmr = torch.compile(model.t3.tfmr, dynamic=True, fullgraph=False)
+        except Exception as e:
+            print(f"torch.compile unavailable, running in eager mode: {e}")
+    autocast_t3(model, device)
+    return model
 
-    try:
-        print(f"Generating audio for: \"{text_to_synthesize}\"")
+def synthesize(model, text_to_synthesize, output_file_path, target_voice, device):
+    print(f"Generating audio for: \"{text_to_synthesize}\"")
+    with torch.inference_mode():
         if target_voice:
             wav = model.generate(text_to_synthesize, audio_prompt_path=target_voice, cfg_weight=.8, exaggeration=.5)
         else:
             wav = model.generate(text_to_synthesize, cfg_weight=.8, exaggeration=.5)
-        ta.save(output_file_path, wav, model.sr)
-        print(f"Audio saved to {output_file_path}")
+    ta.save(output_file_path, wav.float().cpu(), model.sr)
+    print(f"Audio saved to {output_file_path}")
+
+def run_worker(model, target_voice, device, protocol_out):
+    """Serves newline-delimited JSON jobs from stdin until EOF, answering each with one JSON line on protocol_out."""
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        result = {"id": None, "ok": False, "error": None}
+        try:
+            job = json.loads(line)
+            result["id"] = job.get("id")
+            synthesize(model, job["text"], job["output"], target_voice, device)
+            result["ok"] = True
+        except Exception as e:
+            print(f"Error during audio generation or saving: {e}", file=sys.stderr)
+            result["error"] = str(e)
+        protocol_out.write(json.dumps(result) + "\n")
+        protocol_out.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate audio from text using ChatterboxTTS.")
+    parser.add_argument("input_text", type=str, nargs="?", help="The text to synthesize.")
+    parser.add_argument("output_path", type=str, nargs="?", help="The file path to save the generated audio.")
+    parser.add_argument("--worker", action="store_true", help="Keep the model loaded and serve newline-delimited JSON jobs from stdin, one JSON result line per job on stdout.")
+    args = parser.parse_args()
+
+    if not args.worker and (args.input_text is None or not args.output_path):
+        print("Error: Either --worker or both input_text and output_path must be provided.")
+        sys.exit(1)
+
+    protocol_out = sys.stdout
+    if args.worker:
+        # stdout carries the job protocol. Keep a private copy of fd 1 for it and point fd 1 itself at stderr,
+        # so progress output from Python and from native libraries writing to fd 1 can't corrupt the protocol.
+        sys.stdout.flush()
+        protocol_out = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+        os.dup2(2, 1)
+        sys.stdout = sys.stderr
+
+    device = detect_device()
+    print(f"Using device: {device}")
+    target_voice = find_target_voice()
+
+    model = load_model(device)
+
+    if args.worker:
+        run_worker(model, target_voice, device, protocol_out)
+        return
+
+    try:
+        synthesize(model, args.input_text, args.output_path, target_voice, device)
     except Exception as e:
         print(f"Error during audio generation or saving: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,28 +1,115 @@
 import os
 import json
+import shlex
+import concurrent.futures
 import subprocess
 import sys
 import threading
 
+from ..utils.json_utils import load_json_bytes
+from ..utils.stream_utils import echo_lines
+
 def stream_output(pipe, output_list, display_prefix=""):
     """Reads from a pipe and appends to a list, optionally displaying lines."""
+    stream = sys.stderr if display_prefix == "stderr" else sys.stdout
     try:
         if pipe:
-            for line in iter(pipe.readline, ''):
-                if display_prefix == "stderr":
-                    sys.stderr.write(line)
-                    sys.stderr.flush()
-                else:
-                    print(line, end='')
-                    sys.stdout.flush()
-                output_list.append(line)
+            echo_lines(pipe, output_list, stream)
             pipe.close()
     except Exception as e:
         # Handle potential errors during stream reading, e.g., if pipe closes unexpectedly
         # Use a logger if available, otherwise print to stderr
         sys.stderr.write(f"Error reading stream ({display_prefix or 'stdout'}): {e}\n")
+    finally:
+        stream.flush()
+
+def _run_audio_worker(jobs: list[dict], audio_generator_tool_script_path: str, current_project_root: str) -> bool:
+    """Runs jobs through one persistent audio_generator_tool --worker process. Returns True if every job succeeded."""
+    all_successful = True
+    process = None
+    stderr_thread = None
+    stderr_lines = []
+    command = [
+        "uv", "run", audio_generator_tool_script_path,
+        "--worker"
+    ]
+
+    try:
+        sys.stdout.write(f"Executing: {shlex.join(command)}\n")
+        process = subprocess.Popen(
+            command,
+            cwd=current_project_root, # Use specified project root as CWD
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+
+        if process.stderr:
+            stderr_thread = threading.Thread(target=stream_output, args=(process.stderr, stderr_lines, "stderr"))
+            stderr_thread.start()
+
+        for job in jobs:
+            sys.stdout.write(f"\nProcessing speech for scene {job['scene_number']}: \"{job['text'][:60]}{'...' if len(job['text']) > 60 else ''}\"\n")
+            process.stdin.write(json.dumps({"id": job["scene_number"], "text": job["text"], "output": job["output"]}) + "\n")
+            process.stdin.flush()
+
+            result = None
+            while response_line := process.stdout.readline():
+                try:
+                    result = json.loads(response_line)
+                    break
+                except json.JSONDecodeError:
+                    # Stray non-protocol output on the worker's stdout; show it and keep waiting for the reply.
+                    sys.stderr.write(response_line)
+            if result is None:
+                sys.stderr.write(f"ERROR: Audio worker exited before finishing scene {job['scene_number']}.\n")
+                all_successful = False
+                break
+            if not isinstance(result, dict) or result.get("id") != job["scene_number"]:
+                sys.stderr.write(f"ERROR: Audio worker replied out of order for scene {job['scene_number']}: {response_line.strip()}\n")
+                all_successful = False
+                break
+
+            if result.get("ok"):
+                sys.stdout.write(f"Successfully generated: {job['output']}\n")
+            else:
+                sys.stderr.write(f"ERROR: Failed to generate audio for scene {job['scene_number']}: \"{job['text'][:60]}...\" ({result.get('error')})\n")
+                all_successful = False
 
-def generate_audio_from_script(script_json_path: str, output_audio_dir: str, audio_generator_tool_script_path: str, current_project_root: str):
+        process.stdin.close()
+        process.wait()
+        if stderr_thread: stderr_thread.join()
+
+        if process.returncode != 0:
+            sys.stderr.write(f"Command failed with exit code {process.returncode}: {shlex.join(command)}\n")
+            all_successful = False
+
+    except FileNotFoundError:
+        sys.stderr.write(f"CRITICAL ERROR: 'uv' command not found or '{audio_generator_tool_script_path}' not found. Ensure 'uv' is installed and paths are correct.\n")
+        # Do not sys.exit, let the caller decide if it's fatal for the whole pipeline
+        return False # This is a critical failure for this function call
+    except Exception as e:
+        sys.stderr.write(f"An unexpected error occurred while communicating with the audio worker: {e}\n")
+        all_successful = False
+    finally:
+        if process and process.poll() is None:
+            sys.stdout.write("\nEnsuring active audio worker subprocess is terminated...\n")
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                sys.stderr.write("Audio worker subprocess did not terminate gracefully, killing.\n")
+                process.kill()
+                process.wait()
+            sys.stdout.write("Subprocess terminated.\n")
+            if stderr_thread and stderr_thread.is_alive(): stderr_thread.join(timeout=1)
+
+    return all_successful
+
+def generate_audio_from_script(script_json_path: str, output_audio_dir: str, audio_generator_tool_script_path: str, current_project_root: str, script_data: list | None = None, num_workers: int = 1):
     """
     Generates audio files from a script JSON file using an external audio generation tool.
 
@@ -31,10 +118,14 @@ def generate_audio_from_script(script_json_path: str, output_audio_dir: str, aud
         output_audio_dir: Directory to save the generated MP3 files.
         audio_generator_tool_script_path: Absolute path to the audio_generator_tool.py script.
         current_project_root: The root directory of the project, used as CWD for subprocess.
+        script_data: Already-parsed contents of script_json_path. Read from disk when None.
+        num_workers: Number of TTS worker processes to run in parallel. Each loads its own copy of the model.
 
     Returns:
         True if all audio files were generated successfully, False otherwise.
     """
+    if num_workers < 1:
+        raise ValueError(f"num_workers must be at least 1, got {num_workers}.")
     all_successful = True
 
     # 1. Create the output directory if it doesn't exist
@@ -48,8 +139,12 @@ def generate_audio_from_script(script_json_path: str, output_audio_dir: str, aud
     # 2. Open and read the script.json file
     script_items = []
     try:
-        with open(script_json_path, 'r', encoding='utf-8') as f:
-            content = json.load(f)
+        if script_data is not None:
+            content = script_data
+        else:
+            with open(script_json_path, 'rb') as f:
+                raw_script = f.read()
+            content = load_json_bytes(raw_script)
         if isinstance(content, list):
             script_items = content
             sys.stdout.write(f"Successfully read {len(script_items)} entries from {os.path.basename(script_json_path)}.\n")
@@ -70,7 +165,8 @@ def generate_audio_from_script(script_json_path: str, output_audio_dir: str, aud
         sys.stdout.write(f"No items found in {os.path.basename(script_json_path)}. Nothing to process.\n")
         return True # No items to process is not an error in itself for this function
 
-    # 3. Process each script item
+    # 3. Validate each script item and collect the synthesis jobs
+    jobs = []
     for i, item_entry in enumerate(script_items):
         if not isinstance(item_entry, dict):
             sys.stderr.write(f"Warning: Entry {i+1} in {os.path.basename(script_json_path)} is not a dictionary. Skipping.\n")
@@ -89,79 +185,27 @@ def generate_audio_from_script(script_json_path: str, output_audio_dir: str, aud
         output_filename = f"{scene_number}.mp3"
         absolute_output_file_path = os.path.join(output_audio_dir, output_filename)
 
-        sys.stdout.write(f"\nProcessing speech for scene {scene_number} ({i+1}/{len(script_items)}): \"{speech_text[:60]}{'...' if len(speech_text) > 60 else ''}\"\n")
-        sys.stdout.write(f"Target audio file: {absolute_output_file_path}\n")
-
-        # 5. Prepare and run the command
-        command = [
-            "uv", "run", audio_generator_tool_script_path,
-            speech_text,
-            absolute_output_file_path
-        ]
-
-        stdout_lines = []
-        stderr_lines = []
-        process = None
-        stdout_thread = None # Initialize before try block
-        stderr_thread = None # Initialize before try block
-
-        try:
-            sys.stdout.write(f"Executing: {' '.join(command)}\n")
-            process = subprocess.Popen(
-                command,
-                cwd=current_project_root, # Use specified project root as CWD
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8',
-                bufsize=1
-            )
-
-            # stdout_thread = None # These were moved up
-            # stderr_thread = None
-
-            if process.stdout:
-                stdout_thread = threading.Thread(target=stream_output, args=(process.stdout, stdout_lines))
-                stdout_thread.start()
-
-            if process.stderr:
-                stderr_thread = threading.Thread(target=stream_output, args=(process.stderr, stderr_lines, "stderr"))
-                stderr_thread.start()
-
-            if stdout_thread: stdout_thread.join()
-            if stderr_thread: stderr_thread.join()
-            
-            process.wait()
-
-            if process.returncode == 0:
-                sys.stdout.write(f"\nSuccessfully generated: {absolute_output_file_path}\n")
-            else:
-                sys.stderr.write(f"\nERROR: Failed to generate audio for scene {scene_number}: \"{speech_text[:60]}...\"\n")
-                sys.stderr.write(f"Command failed with exit code {process.returncode}: {' '.join(command)}\n")
-                all_successful = False
+        sys.stdout.write(f"Queued scene {scene_number} ({i+1}/{len(script_items)}) -> {absolute_output_file_path}\n")
+        jobs.append({"text": speech_text, "output": absolute_output_file_path, "scene_number": scene_number})
+
+    sys.stdout.write(f"{len(jobs)}/{len(script_items)} items queued for synthesis.\n")
+    if not jobs:
+        sys.stderr.write("No valid speech entries to synthesize.\n")
+        return all_successful
+
+    # 5. Split the jobs across the TTS workers; each worker keeps its model loaded for all of its scenes
+    num_workers = min(num_workers, len(jobs))
+    if num_workers == 1:
+        workers_ok = [_run_audio_worker(jobs, audio_generator_tool_script_path, current_project_root)]
+    else:
+        sys.stdout.write(f"Starting {num_workers} audio workers for {len(jobs)} scenes.\n")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            workers_ok = list(executor.map(
+                lambda worker_jobs: _run_audio_worker(worker_jobs, audio_generator_tool_script_path, current_project_root),
+                [jobs[w::num_workers] for w in range(num_workers)]
+            ))
+    if not all(workers_ok):
+        all_successful = False
 
-        except FileNotFoundError:
-            sys.stderr.write(f"CRITICAL ERROR: 'uv' command not found or '{audio_generator_tool_script_path}' not found. Ensure 'uv' is installed and paths are correct.\n")
-            sys.stderr.write(f"Failed to generate audio for scene {scene_number}: \"{speech_text[:60]}...\"\n")
-            all_successful = False
-            # Do not sys.exit, let the caller decide if it's fatal for the whole pipeline
-            return False # This is a critical failure for this function call
-        except Exception as e:
-            sys.stderr.write(f"An unexpected error occurred while processing speech for scene {scene_number} (\"{speech_text[:60]}...\"): {e}\n")
-            all_successful = False
-        finally:
-            if process and process.poll() is None:
-                sys.stdout.write(f"\nEnsuring active subprocess for speech {scene_number} is terminated...\n")
-                process.terminate()
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    sys.stderr.write(f"Subprocess for speech {scene_number} did not terminate gracefully, killing.\n")
-                    process.kill()
-                    process.wait()
-                sys.stdout.write("Subprocess terminated.\n")
-                if stdout_thread and stdout_thread.is_alive(): stdout_thread.join(timeout=1)
-                if stderr_thread and stderr_thread.is_alive(): stderr_thread.join(timeout=1)
-                        
     sys.stdout.write("\nAudio generation process finished. All speech processing tasks have been attempted.\n")
-    return all_successful
\ No newline at end of file
+    return all_successful
@@ -1,7 +1,11 @@
+import ast
 import sys
 import os
+import shlex
 import subprocess
 import re
+import functools
+import glob
 import textwrap
 import tempfile
 import threading
@@ -17,10 +21,14 @@ if _SRC_DIR not in sys.path:
 
 # Ensure this import works when called from bin/eui.py where src is in sys.path
 from utils.custom_logging import setup_custom_logging, log_node_ctx
+from utils.stream_utils import echo_lines
 
 # --- Helper Functions ---
+_SCENE_CLASS_RE = re.compile(r"class\s+([a-zA-Z0-9_]+)\s*\((?:Scene|MovingCameraScene|ZoomedScene|ThreeDScene)\):")
+
+@functools.lru_cache(maxsize=256) # Repeated code blocks are only scanned once per process
 def find_scene_name(code_string): # Stays mostly the same
-    match = re.search(r"class\s+([a-zA-Z0-9_]+)\s*\((?:Scene|MovingCameraScene|ZoomedScene|ThreeDScene)\):", code_string)
+    match = _SCENE_CLASS_RE.search(code_string)
     if match:
         return match.group(1)
     return None
@@ -43,36 +51,84 @@ def log_error_to_markdown(logger: logging.Logger, error_message: str, code_snipp
     except IOError as e:
         logger.critical(f"Could not write to error log file {error_md_path}: {e}")
 
+def _combine_for_batch_render(code_blocks: list[str]) -> str | None:
+    """Builds one module rendering every block exactly as its own file would, or returns None when that can't be
+    guaranteed. Each block must be its imports followed by definitions/plain assignments, all blocks must share the
+    same imports (emitted once at the top, so no later import can rebind an earlier block's names), no name may be
+    defined by more than one block (a repeated scene class would shadow the earlier one), and no block may reference
+    a name another block defines."""
+    import_sources: list[str] | None = None
+    bodies: list[str] = []
+    defined_names: list[set[str]] = []
+    used_names: list[set[str]] = []
+    for code in code_blocks:
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return None
+        imports = []
+        block_names: set[str] = set()
+        for node in tree.body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                if block_names:
+                    return None # An import after a definition would be reordered by hoisting
+                imports.append(node)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                block_names.add(node.name)
+            elif isinstance(node, ast.Assign) and all(isinstance(t, ast.Name) for t in node.targets):
+                block_names.update(t.id for t in node.targets)
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                block_names.add(node.target.id)
+            else:
+                return None # e.g. top-level config.* mutations would leak into the other scenes
+        block_imports = [ast.unparse(node) for node in imports]
+        if import_sources is None:
+            import_sources = block_imports
+        elif block_imports != import_sources:
+            return None
+        body_start = imports[-1].end_lineno if imports else 0
+        bodies.append("\n".join(code.splitlines()[body_start:]).strip("\n"))
+        defined_names.append(block_names)
+        used_names.append({node.id for node in ast.walk(tree) if isinstance(node, ast.Name)})
+
+    for i, names in enumerate(defined_names):
+        for j, used in enumerate(used_names):
+            if i != j and names & (used | defined_names[j]):
+                return None
+    return "\n".join(import_sources or []) + "\n\n\n" + "\n\n\n".join(bodies) + "\n"
+
+def _rendered_video_exists(media_dir: str, script_path: str, scene_name: str) -> bool:
+    # Manim writes <media_dir>/videos/<script name>/<quality>/<Scene>.mp4 only once a scene has fully rendered.
+    module_name = os.path.splitext(os.path.basename(script_path))[0]
+    return bool(glob.glob(os.path.join(glob.escape(media_dir), "videos", glob.escape(module_name), "*", f"{glob.escape(scene_name)}.mp4")))
+
 def stream_pipe(pipe, output_list: list, logger: logging.Logger, display_prefix: str = ""): # Stays mostly the same
+    stream = sys.stderr if display_prefix == "stderr" else sys.stdout # Echo to the matching console stream
     try:
         if pipe:
-            for line in iter(pipe.readline, ''):
-                if display_prefix == "stderr":
-                    sys.stderr.write(line) # Stream to actual stderr
-                    sys.stderr.flush()
-                else:
-                    sys.stdout.write(line) # Stream to actual stdout
-                    sys.stdout.flush()
-                output_list.append(line) # Collect for logging if needed
+            echo_lines(pipe, output_list, stream) # Collect for logging if needed
     except ValueError:
         logger.info(f"Stream pipe '{display_prefix or 'stdout'}' closed abruptly.")
     except Exception as e:
         logger.error(f"Error in stream_pipe ({display_prefix or 'stdout'}): {e}", exc_info=True)
+    finally:
+        stream.flush()
 
 
-def _trigger_single_render(
+def _trigger_render(
     logger: logging.Logger,
     animation_code: str,
-    scene_name: str,
+    scene_names: list[str],
     temp_script_path: str,
     manim_media_output_for_command: str, # Specific media dir for this Manim call
     error_logging_path: str,
     project_root_cwd: str # CWD for Manim
     ) -> bool:
-    # This function will encapsulate a single Manim call
+    # This function will encapsulate a single Manim call, rendering one or more scenes from one script
     # It will run Manim with cwd=project_root_cwd
     # and --media_dir pointing to manim_media_output_for_command
 
+    scene_name = ", ".join(scene_names)
     with log_node_ctx(logger, f"Rendering Scene: {scene_name} using script {temp_script_path}"):
         try:
             with open(temp_script_path, 'w', encoding='utf-8') as f:
@@ -84,18 +140,17 @@ def _trigger_single_render(
 
         command = [
             "manim", "render",
-            temp_script_path, scene_name,
+            temp_script_path, *scene_names,
             "--media_dir", manim_media_output_for_command,
             "-r", "1080,1920",
             # "--progress_bar", "none", # Disables live progress bar
             # "-ql" # Low quality for speed, consider -qm, -qh
         ]
-        logger.info(f"Executing in CWD '{project_root_cwd}': {' '.join(command)}")
+        logger.info(f"Executing in CWD '{project_root_cwd}': {shlex.join(command)}")
         
         stdout_lines: list[str] = []
         stderr_lines: list[str] = []
         process = None
-        stdout_thread = None
         stderr_thread = None
 
         try:
@@ -108,20 +163,15 @@ def _trigger_single_render(
                 bufsize=1
             )
 
-            if process.stdout:
-                stdout_thread = threading.Thread(target=stream_pipe, args=(process.stdout, stdout_lines, logger, "stdout"))
-                stdout_thread.daemon = True 
-                stdout_thread.start()
-
             if process.stderr:
                 stderr_thread = threading.Thread(target=stream_pipe, args=(process.stderr, stderr_lines, logger, "stderr"))
                 stderr_thread.daemon = True
                 stderr_thread.start()
 
-            if process: process.wait() # Wait for Popen to complete.
+            # Drain stdout on this thread (it would otherwise just sit in wait()), so only stderr needs a helper thread.
+            stream_pipe(process.stdout, stdout_lines, logger, "stdout")
+            process.wait()
 
-            # Ensure threads complete by joining them
-            if stdout_thread and stdout_thread.is_alive(): stdout_thread.join(timeout=5)
             if stderr_thread and stderr_thread.is_alive(): stderr_thread.join(timeout=5)
 
             if process and process.returncode == 0:
@@ -205,6 +255,7 @@ def render_manim_scenes(code_md_path: str, final_manim_output_media_dir: str, pr
         os.makedirs(temp_manim_native_output_dir, exist_ok=True)
         logger.info(f"Main temporary directory for this run: {main_temp_dir}")
 
+        scenes_to_render: list[tuple[int, str, str]] = [] # (block index, code, scene name)
         for i, raw_code in enumerate(animations):
             with log_node_ctx(logger, f"Processing Animation Block {i + 1} of {total_animations}"):
                 code = textwrap.dedent(raw_code).strip()
@@ -220,20 +271,47 @@ def render_manim_scenes(code_md_path: str, final_manim_output_media_dir: str, pr
                     continue
 
                 logger.info(f"Identified Scene: {scene_name}")
-                # Use a unique name for the temp script file to avoid clashes if scene names are reused
-                temp_script_file_path = os.path.join(temp_scripts_dir, f"scene_{i+1}_{scene_name}.py")
-
-                scene_render_success = _trigger_single_render(
-                    logger,
-                    code,
-                    scene_name,
-                    temp_script_file_path,
-                    temp_manim_native_output_dir,
-                    error_md_log_path,
-                    project_root_path
-                )
-                if not scene_render_success:
-                    all_scenes_processed_successfully = False
+                scenes_to_render.append((i, code, scene_name))
+
+        # Render every scene from one combined script in a single Manim process when the blocks can share a module,
+        # so the interpreter and Manim import cost is paid once; otherwise (or if that fails) render scene by scene.
+        combined_code = _combine_for_batch_render([code for _, code, _ in scenes_to_render]) if len(scenes_to_render) > 1 else None
+        if combined_code is not None:
+            combined_script_path = os.path.join(temp_scripts_dir, "all_scenes.py")
+            batch_rendered = _trigger_render(
+                logger,
+                combined_code,
+                [scene_name for _, _, scene_name in scenes_to_render],
+                combined_script_path,
+                temp_manim_native_output_dir,
+                error_md_log_path,
+                project_root_path
+            )
+            if batch_rendered:
+                scenes_to_render = []
+            else:
+                # Scenes the batch finished before the failure keep their videos; only the rest are rendered again.
+                scenes_to_render = [
+                    scene for scene in scenes_to_render
+                    if not _rendered_video_exists(temp_manim_native_output_dir, combined_script_path, scene[2])
+                ]
+                logger.warning(f"Batch render failed. Falling back to rendering the {len(scenes_to_render)} unfinished scene(s) separately.")
+
+        for i, code, scene_name in scenes_to_render:
+            # Use a unique name for the temp script file to avoid clashes if scene names are reused
+            temp_script_file_path = os.path.join(temp_scripts_dir, f"scene_{i+1}_{scene_name}.py")
+
+            scene_render_success = _trigger_render(
+                logger,
+                code,
+                [scene_name],
+                temp_script_file_path,
+                temp_manim_native_output_dir,
+                error_md_log_path,
+                project_root_path
+            )
+            if not scene_render_success:
+                all_scenes_processed_successfully = False
 
         # After all scenes, move generated media to the final destination
         if os.path.exists(temp_manim_native_output_dir) and any(os.scandir(temp_manim_native_output_dir)):
@@ -1,4 +1,3 @@
-import json
 import os
 import glob
 import tempfile
@@ -15,6 +14,7 @@ if _SRC_DIR not in sys.path:
     sys.path.insert(0, _SRC_DIR)
 
 from utils.custom_logging import setup_custom_logging, log_node_ctx # Added
+from utils.json_utils import load_json_bytes
 
 def get_media_duration(logger: logging.Logger, media_path: str) -> float | None:
     try:
@@ -42,7 +42,8 @@ def create_video_from_script(
     output_filepath: str, # Changed: absolute path
     crf=23,
     enable_speed_up: bool = False,
-    target_duration_minutes: float = 1.0
+    target_duration_minutes: float = 1.0,
+    script_items: list | None = None # Already-parsed script; read from script_filepath when None
 ):
     with log_node_ctx(logger, "Video Creation Process"):
         # script_filepath is now absolute
@@ -56,16 +57,18 @@ def create_video_from_script(
             temp_dir = tempfile.mkdtemp(prefix="video_processing_")
             logger.info(f"Created temporary directory: {temp_dir}")
 
-            if not os.path.exists(script_filepath):
-                logger.error(f"Script file not found at {script_filepath}")
-                return
+            if script_items is None:
+                if not os.path.exists(script_filepath):
+                    logger.error(f"Script file not found at {script_filepath}")
+                    return
 
-            try:
-                with open(script_filepath, 'r', encoding='utf-8') as f:
-                    script_items = json.load(f)
-            except Exception as e:
-                logger.error(f"Error reading or parsing script file {script_filepath}: {e}", exc_info=True)
-                return
+                try:
+                    with open(script_filepath, 'rb') as f:
+                        raw_script = f.read()
+                    script_items = load_json_bytes(raw_script)
+                except Exception as e:
+                    logger.error(f"Error reading or parsing script file {script_filepath}: {e}", exc_info=True)
+                    return
 
             if not script_items:
                 logger.info("No items found in script.json. Exiting.")
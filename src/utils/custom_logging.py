@@ -1,4 +1,5 @@
 import logging
+import os
 import threading
 from contextlib import contextmanager
 
@@ -34,9 +35,12 @@ class ColoredIndentedFormatter(logging.Formatter):
         logging.CRITICAL: BOLD_RED + BASE_FORMAT + RESET,
     }
 
+    # One Formatter per level, built once instead of on every record.
+    FORMATTERS = {levelno: logging.Formatter(fmt) for levelno, fmt in FORMATS.items()}
+    DEFAULT_FORMATTER = logging.Formatter(BASE_FORMAT)
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno, self.BASE_FORMAT)
-        formatter = logging.Formatter(log_fmt)
+        formatter = self.FORMATTERS.get(record.levelno, self.DEFAULT_FORMATTER)
         indent_str = get_indent_str()
         original_message = formatter.format(record)
         indented_message = "\n".join(
@@ -44,8 +48,14 @@ class ColoredIndentedFormatter(logging.Formatter):
         )
         return indented_message
 
-def setup_custom_logging(logger_name="AppLogger", level=logging.INFO) -> logging.Logger:
+def setup_custom_logging(logger_name="AppLogger", level=None) -> logging.Logger:
     logger_instance = logging.getLogger(logger_name)
+    # EUI_LOG_LEVEL=WARNING silences the per-node progress logging in the agents' hot paths.
+    invalid_env_level = None
+    if level is None:
+        level = os.getenv("EUI_LOG_LEVEL", "INFO").upper()
+        if not isinstance(logging.getLevelName(level), int): # Unknown names map to "Level <name>" strings
+            invalid_env_level, level = level, "INFO"
     logger_instance.setLevel(level)
     
     if not any(isinstance(h, logging.StreamHandler) and isinstance(h.formatter, ColoredIndentedFormatter) for h in logger_instance.handlers):
@@ -53,6 +63,8 @@ def setup_custom_logging(logger_name="AppLogger", level=logging.INFO) -> logging
         handler.setFormatter(ColoredIndentedFormatter())
         logger_instance.addHandler(handler)
         logger_instance.propagate = False
+    if invalid_env_level is not None:
+        logger_instance.warning(f"Unknown EUI_LOG_LEVEL '{invalid_env_level}'; using INFO.")
     return logger_instance
 
 @contextmanager
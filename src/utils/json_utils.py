@@ -0,0 +1,21 @@
+import json
+
+try:
+    import orjson # Optional C-accelerated JSON; stdlib json is used when it is not installed
+except ImportError:
+    orjson = None
+
+
+def load_json_bytes(raw: bytes | str):
+    """Parses a JSON document with orjson when available, else with the stdlib json module.
+
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers only need to catch the latter.
+    """
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def dump_json_bytes(data) -> bytes:
+    """Serializes data as 2-space indented UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
@@ -0,0 +1,26 @@
+import time
+
+STREAM_FLUSH_LINES = 64 # Echoed child output is flushed at most every this many lines...
+STREAM_FLUSH_SECONDS = 0.016 # ...or once this much time has passed since the last flush
+
+
+def echo_lines(pipe, output_list: list, stream) -> None:
+    """Copies each line of pipe to stream and appends it to output_list until the pipe closes.
+
+    Flushes every STREAM_FLUSH_LINES lines or STREAM_FLUSH_SECONDS instead of once per line, and once more
+    when the pipe closes.
+    """
+    last_flush = time.monotonic()
+    pending_lines = 0
+    try:
+        for line in iter(pipe.readline, ''):
+            stream.write(line)
+            output_list.append(line)
+            pending_lines += 1
+            now = time.monotonic()
+            if pending_lines >= STREAM_FLUSH_LINES or now - last_flush >= STREAM_FLUSH_SECONDS:
+                stream.flush()
+                last_flush = now
+                pending_lines = 0
+    finally:
+        stream.flush()